@@ -0,0 +1,296 @@
+#####################################################
+#
+# Benchmark suite of the scheduler hot paths
+#
+#####################################################
+
+import argparse
+import sys
+import csv
+import json
+import math
+import multiprocessing
+import resource
+import timeit
+import numpy
+import networkx as nx
+
+from DRCommon import *
+from DRTopo import *
+from DRLogger import *
+from DRRequest import *
+from DRFlowTable import *
+from DRScheduler import *
+
+def DRMaxRSS():
+	"""
+	Return: peak resident memory of this process so far, in KBytes
+	"""
+	return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def DRBenchCase(task):
+	"""
+	Benchmark one (k, flow number) case, in a process of its own so that the peak memory is the case's.
+	Input:
+		task: (k, flows, flow_num, seed, sample, algs, components)
+	Output:
+		list of row dicts, one per algorithm or component, with the fields of DRBenchmark.FIELDS
+	"""
+	k, n, flow_num, seed, sample, algs, components = task
+	timer = timeit.default_timer
+	rss_base = DRMaxRSS()
+	logger = DRLogger()
+	logger.level = DRLogger.SILENT
+	sch = DRScheduler(DRTopo.FatTree(k), logger = logger)
+	hosts = sorted(sch.topo.layer[DRCommon.HOST])
+
+	# The workload only depends on the seed, k and n
+	numpy.random.seed(seed)
+	flows = DRRequest.QueryAggrBatch(len(hosts), int(math.ceil(n / float(flow_num))), flow_num = flow_num)[:n]
+	table = DRFlowTable.fromBatch(flows, hosts)
+	sample_lst = [table.flow(i) for i in xrange(min(sample, n))]
+
+	rows = []
+	def row(name, lat, total = None, admitted = None):
+		calls = len(lat)
+		if total == None:
+			total = sum(lat)
+		p50, p99 = numpy.percentile(lat, [50, 99]) * 1000 if calls else (float('nan'), float('nan'))
+		rows.append({'k':k, 'flows':n, 'name':name, 'calls':calls, 'total_s':total,
+					'flows_per_s':calls / total if total > 0 else float('nan'), 'p50_ms':float(p50), 'p99_ms':float(p99),
+					'rss_base_kb':rss_base, 'rss_peak_kb':DRMaxRSS(), 'admitted':admitted, 'seed':seed})
+
+	def timed(name, call, args_lst):
+		lat = []
+		for args in args_lst:
+			st = timer()
+			call(*args)
+			lat.append(timer() - st)
+		row(name, lat)
+
+	# Path searches on the empty network, the BFS with the closed-form fattree paths off so that it does search
+	if 'DRFatTreePath' in components:
+		timed('DRFatTreePath', lambda flow: sch.DRFatTreePath(flow, sch.DRNewEdgeMark()), [(flow,) for flow in sample_lst])
+	if 'DRBFS' in components:
+		paths = sch.paths
+		sch.paths = None
+		timed('DRBFS', lambda flow: sch.DRBFS(flow, sch.DRNewEdgeMark()), [(flow,) for flow in sample_lst])
+		sch.paths = paths
+	if 'ECMPBFS' in components:
+		timed('ECMPBFS', sch.ECMPBFS, [(flow, None) for flow in sample_lst])
+
+	# Top-level algorithms over the whole batch, keeping the network loaded by the first one
+	loaded = None
+	for alg in algs:
+		sch.flow_lat = []
+		st = timer()
+		res = getattr(sch, alg)(table)
+		total = timer() - st
+		row(alg, sch.flow_lat, total, int(res.admitted.sum()))
+		sch.flow_lat = None
+		if loaded == None:
+			loaded = sch.snapshot()
+
+	# Validation and insertion on the loaded network
+	if loaded == None:
+		sch.init()
+		loaded = sch.snapshot()
+	sch.restore(loaded)
+	path_lst = []
+	for flow in sample_lst:
+		p_lst = sch.ECMPBFS(flow, None)
+		if p_lst and len(p_lst[0]) > 1:
+			p = p_lst[0]
+			path_lst.append((flow, p, [(p[i], p[i+1]) for i in xrange(len(p)-1)]))
+	if 'DRPathValidation' in components:
+		timed('DRPathValidation', sch.DRPathValidation, [(flow, p) for flow, p, edge_lst in path_lst])
+	if 'DRFindMinimalEdge' in components:
+		timed('DRFindMinimalEdge', sch.DRFindMinimalEdge, [(flow, edge_lst) for flow, p, edge_lst in path_lst])
+	if 'DRInsertFlow' in components:
+		lat = []
+		for flow in sample_lst:
+			res = sch.DRRouteFlow(flow)
+			if res == None:
+				continue
+			st = timer()
+			sch.DRInsertFlow(flow, res[1], res[2])
+			lat.append(timer() - st)
+		row('DRInsertFlow', lat)
+
+	return rows
+
+
+def DRRandomTopo(switches, links, seed = 0):
+	"""
+	Return: a G(n, m) random graph of switches, with one host under each switch
+	"""
+	g = nx.gnm_random_graph(switches, links, seed = seed)
+	pairs = g.edges()
+	names = ['S-%d' % i for i in xrange(switches)] + ['H-%d' % i for i in xrange(switches)]
+	layer = [DRCommon.CORE] * switches + [DRCommon.HOST] * switches
+	attr = (DRTopo.DEF_BW, DRTopo.DEF_DL, DRTopo.DEF_CT)
+	return DRTopo.fromLinks(names, layer, [(numpy.array([a for a, b in pairs]), numpy.array([b for a, b in pairs]), attr),
+										(numpy.arange(switches, 2 * switches), numpy.arange(switches), attr)])
+
+def DRCheckTopos():
+	"""
+	Return: list of (name, DRTopo) the searches run on, none of them answered by the closed-form fattree paths
+	"""
+	ft = DRTopo.FatTree(4)
+	ft.fattree = None
+	topo_lst = [('fattree-4-searched', ft), ('leafspine-6-3-4', DRTopo.LeafSpine(6, 3, 4))]
+	for seed in (1, 2, 3):
+		rnd = DRRandomTopo(30, 70, seed)
+		# The same graph held by networkx, whose plain DiGraph lists the neighbors in its own order
+		topo_lst += [('random-30-%d' % seed, rnd), ('random-30-%d-networkx' % seed, DRTopo(topo = rnd.topo))]
+	return topo_lst
+
+def DRCrossCheck(topo, req_lst, configs, alg = 'DROfflineNoValuation'):
+	"""
+	Run alg under several scheduler configurations that must decide alike
+	Input:
+		configs: list of (name, keyword arguments of DRScheduler)
+	Output:
+		list of (name, admitted flows, whether every decision, path and finish time equals those of the first configuration)
+	"""
+	logger = DRLogger()
+	logger.level = DRLogger.SILENT
+	rows = []
+	ref = None
+	for name, kwargs in configs:
+		sch = DRScheduler(topo, logger = logger, **kwargs)
+		succ_lst, fail_lst = getattr(sch, alg)(req_lst)
+		res = [(res[0], res[1], res[3]) for res in succ_lst]
+		if ref == None:
+			ref = res
+		rows.append((name, len(succ_lst), res == ref))
+	return rows
+
+
+class DRBenchmark(DRCommon):
+	"""
+	Timing of the scheduler hot paths and algorithms over fattree sizes and batch sizes.
+		ks: fattree arities; flow_nums: flows per batch, drawn by DRRequest.QueryAggrBatch
+		flow_num: flows per request; seed: seed of every workload
+		sample: flows timed one by one for the components
+		isolate: run each case in a fresh process, otherwise the peak memory accumulates over the cases
+	The full default grid includes k=32 with 10^5 flows and takes hours; narrow it for quick checks.
+	"""
+
+	KS			= [4, 8, 16, 32]
+	FLOW_NUMS	= [100, 1000, 10000, 100000]
+	ALGORITHMS	= ['DROfflineNoValuation', 'DROnlineNoValuation', 'ECMPOffline']
+	COMPONENTS	= ['DRFatTreePath', 'DRBFS', 'ECMPBFS', 'DRPathValidation', 'DRFindMinimalEdge', 'DRInsertFlow']
+	FIELDS		= ['k', 'flows', 'name', 'calls', 'total_s', 'flows_per_s', 'p50_ms', 'p99_ms',
+					'rss_base_kb', 'rss_peak_kb', 'admitted', 'seed']
+	# Scheduler configurations that must take the same decisions, see check()
+	CHECK_CONFIGS	= [('networkx', {'compact':False, 'reroute':DRScheduler.REROUTE_RESTART}),
+					('networkx-incr', {'compact':False, 'reroute':DRScheduler.REROUTE_INCR}),
+					('compact', {'compact':True, 'reroute':DRScheduler.REROUTE_RESTART}),
+					('compact-incr', {'compact':True, 'reroute':DRScheduler.REROUTE_INCR})]
+	CHECK_RUNS		= 4
+
+	def __init__(self, ks = None, flow_nums = None, flow_num = 20, seed = 0, sample = 1000, algs = None, components = None, isolate = True):
+		self.ks = ks if ks != None else DRBenchmark.KS
+		self.flow_nums = flow_nums if flow_nums != None else DRBenchmark.FLOW_NUMS
+		self.flow_num = flow_num
+		self.seed = seed
+		self.sample = sample
+		self.algs = algs if algs != None else DRBenchmark.ALGORITHMS
+		self.components = components if components != None else DRBenchmark.COMPONENTS
+		self.isolate = isolate
+
+	def tasks(self):
+		return [(k, n, self.flow_num, self.seed, self.sample, self.algs, self.components) for k in self.ks for n in self.flow_nums]
+
+	def run(self, logger = None):
+		"""
+		Output:
+			list of row dicts, see DRBenchmark.FIELDS
+		"""
+		logger = DRLogger(logger)
+		rows = []
+		for task in self.tasks():
+			logger.log('[INFO] Benchmark: k = %d, %d flows.' % (task[0], task[1]))
+			if self.isolate:
+				pool = multiprocessing.Pool(1, maxtasksperchild = 1)
+				try:
+					rows.extend(pool.apply(DRBenchCase, (task,)))
+				finally:
+					pool.close()
+					pool.join()
+			else:
+				rows.extend(DRBenchCase(task))
+		return rows
+
+	def check(self, logger = None):
+		"""
+		Cross-check the configurations of CHECK_CONFIGS over DRCheckTopos(), on CHECK_RUNS congested QueryAggr workloads
+		Output:
+			list of (topology, seed, configuration, admitted flows, equal to the first configuration)
+		"""
+		logger = DRLogger(logger)
+		rows = []
+		for name, topo in DRCheckTopos():
+			hosts = sorted(topo.layer[DRCommon.HOST])
+			for seed in xrange(self.seed, self.seed + DRBenchmark.CHECK_RUNS):
+				numpy.random.seed(seed)
+				req_lst = [DRRequest.QueryAggr(hosts, flow_num = self.flow_num, avr_dl = 0.3) for i in xrange(60)]
+				for conf, admitted, same in DRCrossCheck(topo, req_lst, DRBenchmark.CHECK_CONFIGS):
+					logger.info('[INFO] Check: %-24s seed %-3d %-14s %6d admitted %s', name, seed, conf, admitted,
+								'same' if same else 'DIFFERENT')
+					rows.append((name, seed, conf, admitted, same))
+		return rows
+
+	@staticmethod
+	def writeJSON(file, rows):
+		# JSON has no NaN, the undefined figures (e.g. percentiles of no call) are written as null
+		rows = [{key:(None if type(val) == float and math.isnan(val) else val) for key, val in r.iteritems()} for r in rows]
+		with open(file, 'w') as f:
+			json.dump(rows, f, indent = 1, sort_keys = True, allow_nan = False)
+
+	@staticmethod
+	def writeCSV(file, rows):
+		with open(file, 'wb') as f:
+			w = csv.DictWriter(f, DRBenchmark.FIELDS)
+			w.writeheader()
+			w.writerows(rows)
+
+	@staticmethod
+	def format(rows):
+		"""
+		Return: the rows as a text table
+		"""
+		lines = ['%4s %7s %-22s %7s %10s %12s %10s %10s %10s' % ('k', 'flows', 'name', 'calls', 'total_s', 'flows/s', 'p50_ms', 'p99_ms', 'peak_MB')]
+		for r in rows:
+			lines.append('%4d %7d %-22s %7d %10.3f %12.1f %10.4f %10.4f %10.1f' % (r['k'], r['flows'], r['name'], r['calls'],
+						r['total_s'], r['flows_per_s'], r['p50_ms'], r['p99_ms'], r['rss_peak_kb'] / 1024.0))
+		return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description = 'Benchmark the scheduler hot paths over fattree and batch sizes.')
+	parser.add_argument('-k', type = int, nargs = '+', default = None, help = 'fattree arities, default to %s' % DRBenchmark.KS)
+	parser.add_argument('--flows', type = int, nargs = '+', default = None, help = 'flows per batch, default to %s' % DRBenchmark.FLOW_NUMS)
+	parser.add_argument('--flow-num', type = int, default = 20, help = 'flows per request')
+	parser.add_argument('--seed', type = int, default = 0, help = 'workload seed')
+	parser.add_argument('--sample', type = int, default = 1000, help = 'flows timed one by one for the components')
+	parser.add_argument('--algs', nargs = '+', default = None, help = 'algorithms, default to %s' % DRBenchmark.ALGORITHMS)
+	parser.add_argument('--components', nargs = '+', default = None, help = 'components, default to %s' % DRBenchmark.COMPONENTS)
+	parser.add_argument('--inline', action = 'store_true', help = 'run the cases in this process')
+	parser.add_argument('--json', default = None, help = 'write the rows to this JSON file')
+	parser.add_argument('--csv', default = None, help = 'write the rows to this CSV file')
+	parser.add_argument('--check', action = 'store_true', help = 'check that the search configurations decide alike instead')
+	args = parser.parse_args()
+
+	bench = DRBenchmark(ks = args.k, flow_nums = args.flows, flow_num = args.flow_num, seed = args.seed, sample = args.sample,
+						algs = args.algs, components = args.components, isolate = not args.inline)
+	if args.check:
+		rows = bench.check()
+		sys.exit(0 if all(row[4] for row in rows) else 1)
+	rows = bench.run()
+	print DRBenchmark.format(rows)
+	if args.json:
+		DRBenchmark.writeJSON(args.json, rows)
+	if args.csv:
+		DRBenchmark.writeCSV(args.csv, rows)
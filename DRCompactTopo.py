@@ -0,0 +1,263 @@
+#####################################################
+#
+# Integer-indexed compact topology for the hot loops
+#
+#####################################################
+
+import zipfile
+import numpy
+import numpy.lib.format
+import networkx as nx
+
+from DRCommon import *
+
+class DRCompactTopo(DRCommon):
+	"""
+	CSR-style adjacency of a directed topology, nodes and edges being numbered from 0.
+		names: node id -> node name; ids: node name -> node id
+		layer: node id -> layer (-1 if unknown)
+		adj_ptr: out-edges of node u are adj_ptr[u]:adj_ptr[u+1] in adj_node/adj_edge
+		adj_node, adj_edge: head node id and edge id of each out-edge
+		src, dst: endpoints of each edge id; edge_lst: (u, v) names of each edge id; edge_id: (u, v) names -> edge id
+		cap, delay, cost: edge attributes indexed by edge id
+		nbr, nbr_edge: out-neighbor ids and out-edge ids of each node, as lists for the Python search loops
+		rnbr, rnbr_edge: in-neighbor ids and in-edge ids of each node, likewise
+		grouped: the edges are already grouped by tail node, as save() writes them
+	Out-edges keep the order they are given in, so searches visit neighbors as on the networkx graph.
+	Only the arrays are set up at construction; the per-node lists and the edge names are built on first use,
+	so a topology mapped from a file holds no per-edge Python object until a search or the scheduler needs it.
+	"""
+
+	def __init__(self, names, layer, src, dst, cap, delay, cost, grouped = False):
+		self.names = list(names)
+		self.ids = {v:i for i, v in enumerate(self.names)}
+		self.layer = numpy.asarray(layer, dtype=numpy.int8)
+		self.src = numpy.asarray(src, dtype=numpy.int32)
+		self.dst = numpy.asarray(dst, dtype=numpy.int32)
+		self.cap = numpy.asarray(cap, dtype=float)
+		self.delay = numpy.asarray(delay, dtype=float)
+		self.cost = numpy.asarray(cost, dtype=float)
+		self.node_num = len(self.names)
+		self.edge_num = len(self.src)
+
+		if grouped:
+			# Edge ids are already in adjacency order, and the offsets come from bisecting the tails
+			self.adj_edge = numpy.arange(self.edge_num, dtype=numpy.int32)
+			self.adj_node = self.dst
+			self.adj_ptr = numpy.searchsorted(self.src, numpy.arange(self.node_num + 1)).astype(numpy.int32)
+		else:
+			# Group the out-edges by tail node, stable so the given order is kept within a node
+			order = numpy.argsort(self.src, kind='mergesort').astype(numpy.int32)
+			self.adj_edge = order
+			self.adj_node = self.dst[order]
+			self.adj_ptr = numpy.zeros(self.node_num + 1, dtype=numpy.int32)
+			numpy.cumsum(numpy.bincount(self.src, minlength=self.node_num), out=self.adj_ptr[1:])
+
+		# Built on first use, see nbr and edge_lst
+		self.adj_lists = None
+		self.rev_lists = None
+		self.edge_names = None
+
+	@property
+	def nbr(self):
+		if self.adj_lists is None:
+			self.buildLists()
+		return self.adj_lists[0]
+
+	@property
+	def nbr_edge(self):
+		if self.adj_lists is None:
+			self.buildLists()
+		return self.adj_lists[1]
+
+	def buildLists(self):
+		# Plain lists for the Python search loops, where indexing NumPy scalars would be slower
+		ptr = self.adj_ptr.tolist()
+		adj_node = self.adj_node.tolist()
+		adj_edge = self.adj_edge.tolist()
+		self.adj_lists = ([adj_node[ptr[u]:ptr[u+1]] for u in xrange(self.node_num)],
+						[adj_edge[ptr[u]:ptr[u+1]] for u in xrange(self.node_num)])
+
+	@property
+	def rnbr(self):
+		if self.rev_lists is None:
+			self.buildRevLists()
+		return self.rev_lists[0]
+
+	@property
+	def rnbr_edge(self):
+		if self.rev_lists is None:
+			self.buildRevLists()
+		return self.rev_lists[1]
+
+	def buildRevLists(self):
+		# In-edges grouped by head node, in the order of the out-edges
+		order = self.adj_edge[numpy.argsort(self.adj_node, kind='mergesort')]
+		ptr = numpy.zeros(self.node_num + 1, dtype=numpy.int64)
+		numpy.cumsum(numpy.bincount(self.dst, minlength=self.node_num), out=ptr[1:])
+		ptr = ptr.tolist()
+		rev_node = self.src[order].tolist()
+		rev_edge = order.tolist()
+		self.rev_lists = ([rev_node[ptr[v]:ptr[v+1]] for v in xrange(self.node_num)],
+						[rev_edge[ptr[v]:ptr[v+1]] for v in xrange(self.node_num)])
+
+	@property
+	def edge_lst(self):
+		if self.edge_names is None:
+			self.buildEdgeNames()
+		return self.edge_names[0]
+
+	@property
+	def edge_id(self):
+		if self.edge_names is None:
+			self.buildEdgeNames()
+		return self.edge_names[1]
+
+	def buildEdgeNames(self):
+		name_arr = numpy.empty(self.node_num, dtype=object)
+		name_arr[:] = self.names
+		edge_lst = zip(name_arr[self.src].tolist(), name_arr[self.dst].tolist())
+		self.edge_names = (edge_lst, dict(zip(edge_lst, xrange(self.edge_num))))
+
+	def edge(self, eid):
+		"""
+		Return: (u, v) node names of an edge id
+		"""
+		return (self.names[self.src[eid]], self.names[self.dst[eid]])
+
+	@staticmethod
+	def fromGraph(g):
+		"""
+		Compile a networkx DiGraph with Layer node attributes and Capacity/Delay/Cost edge attributes
+		"""
+		names = g.nodes()
+		ids = {v:i for i, v in enumerate(names)}
+		layer = []
+		for v in names:
+			l = g.node[v].get('Layer', -1)
+			if type(l) == str:
+				l = DRCommon.LAYER_MAP.get(l.upper(), -1)
+			if type(l) != int:
+				l = -1
+			layer.append(l)
+
+		src = []; dst = []; cap = []; delay = []; cost = []
+		for u in names:
+			for v, attr in g.adj[u].items():
+				src.append(ids[u])
+				dst.append(ids[v])
+				cap.append(attr.get('Capacity', 1))
+				delay.append(attr.get('Delay', 1))
+				cost.append(attr.get('Cost', 1))
+
+		return DRCompactTopo(names, layer, src, dst, cap, delay, cost)
+
+	def toGraph(self):
+		"""
+		Return: the networkx DiGraph of the topology, with Layer, Capacity, Delay and Cost attributes
+			Ordered, so that the graph lists the nodes and the neighbors as the arrays do and the searches
+			over either break ties alike
+		"""
+		g = nx.OrderedDiGraph()
+		names = self.names
+		g.add_nodes_from((v, {'Layer':l}) for v, l in zip(names, self.layer.tolist()))
+		g.add_edges_from((names[u], names[v], {'Capacity':c, 'Delay':d, 'Cost':ct}) for u, v, c, d, ct in
+						zip(self.src.tolist(), self.dst.tolist(), self.cap.tolist(), self.delay.tolist(), self.cost.tolist()))
+		return g
+
+	# Arrays of the .npz topology format
+	NPZ_KEYS	= ['names', 'layer', 'src', 'dst', 'cap', 'delay', 'cost']
+
+	def save(self, file, fattree = None):
+		"""
+		Write the topology as an uncompressed .npz, edges grouped by tail node so loading needs no sorting
+			fattree: arity k if the topology is a fattree named as by DRTopo.FatTree
+		"""
+		order = self.adj_edge
+		numpy.savez(file, names = numpy.array(self.names, dtype=str), layer = self.layer,
+					src = self.src[order], dst = self.dst[order], cap = self.cap[order], delay = self.delay[order],
+					cost = self.cost[order], fattree = numpy.int32(fattree or 0))
+
+	@staticmethod
+	def load(file, mmap = True):
+		"""
+		Read a topology written by save()
+			mmap: map the arrays of the file instead of reading them
+		Output:
+			(DRCompactTopo, fattree arity or None)
+		"""
+		if mmap:
+			arr = DRCompactTopo.mapNpz(file)
+		else:
+			arr = numpy.load(file)
+		topo = DRCompactTopo(arr['names'].tolist(), *[arr[key] for key in DRCompactTopo.NPZ_KEYS[1:]], grouped = True)
+		return topo, int(arr['fattree']) or None
+
+	@staticmethod
+	def mapNpz(file):
+		"""
+		Memory-map the arrays stored uncompressed in a .npz
+		Output:
+			dict of name -> read-only numpy.memmap, or plain array for the scalars and empty ones
+		"""
+		arr = {}
+		zf = zipfile.ZipFile(file)
+		with open(file, 'rb') as f:
+			for info in zf.infolist():
+				if info.compress_type != zipfile.ZIP_STORED:
+					raise ValueError('%s: compressed member %s cannot be mapped' % (file, info.filename))
+				# Local file header: 30 bytes, then the name and the extra field whose lengths are at bytes 26 and 28
+				f.seek(info.header_offset + 26)
+				name_len, extra_len = numpy.frombuffer(f.read(4), dtype='<u2')
+				f.seek(info.header_offset + 30 + name_len + extra_len)
+				version = numpy.lib.format.read_magic(f)
+				if version == (1, 0):
+					shape, fortran, dtype = numpy.lib.format.read_array_header_1_0(f)
+				else:
+					shape, fortran, dtype = numpy.lib.format.read_array_header_2_0(f)
+				key = info.filename[:-4] if info.filename.endswith('.npy') else info.filename
+				if len(shape) == 0 or numpy.prod(shape) == 0:
+					# Scalars and empty arrays are read
+					arr[key] = numpy.fromfile(f, dtype=dtype, count=int(numpy.prod(shape))).reshape(shape)
+				else:
+					arr[key] = numpy.memmap(file, dtype=dtype, mode='r', offset=f.tell(), shape=shape,
+											order='F' if fortran else 'C')
+		zf.close()
+		return arr
+
+
+class DREdgeMark(DRCommon):
+	"""
+	Reusable edge mask over the edge ids of a compact topology.
+	An edge is marked when its stamp equals the current generation, so clearing every mark is one increment.
+	Indexing by (u, v) node names works as for the {edge: False} dict it replaces.
+	"""
+
+	def __init__(self, csr):
+		self.csr = csr
+		self.stamp = [0] * csr.edge_num
+		self.gen = 1
+
+	def clear(self):
+		self.gen += 1
+
+	def marked(self, eid):
+		return self.stamp[eid] == self.gen
+
+	def mark(self, eid):
+		self.stamp[eid] = self.gen
+
+	def __getitem__(self, e):
+		return self.stamp[self.csr.edge_id[e]] == self.gen
+
+	def get(self, e, default = False):
+		eid = self.csr.edge_id.get(e)
+		if eid is None:
+			return default
+		return self.stamp[eid] == self.gen
+
+	def __setitem__(self, e, flag):
+		eid = self.csr.edge_id.get(e)
+		if eid is None:
+			return
+		self.stamp[eid] = self.gen if flag else 0
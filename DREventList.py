@@ -0,0 +1,140 @@
+#####################################################
+#
+# Sorted event timestamps of the scheduler
+#
+#####################################################
+
+from bisect import *
+
+from DRCommon import *
+
+class DREventList(DRCommon):
+	"""
+	Sorted set of the event timestamps, held as a list of sorted blocks of at most 2 * LOAD timestamps each.
+	Lookups bisect the block maxima then one block, and an insertion or a removal only moves the timestamps
+	of its block, where list.insert moved half of the whole list.
+		irange(st, ed): the events in (st, ed], reading only the blocks overlapping the window
+		prune(time): drop the events before time
+	"""
+
+	LOAD	= 256
+
+	def __init__(self, times = None):
+		self.blocks = []
+		self.maxes = []
+		self.size = 0
+		if times:
+			times = sorted(set(times))
+			load = DREventList.LOAD
+			self.blocks = [times[i:i+load] for i in xrange(0, len(times), load)]
+			self.maxes = [blk[-1] for blk in self.blocks]
+			self.size = len(times)
+
+	def copy(self):
+		evt = DREventList()
+		evt.blocks = [list(blk) for blk in self.blocks]
+		evt.maxes = list(self.maxes)
+		evt.size = self.size
+		return evt
+
+	def __len__(self):
+		return self.size
+
+	def __iter__(self):
+		for blk in self.blocks:
+			for time in blk:
+				yield time
+
+	def __contains__(self, time):
+		i = bisect_left(self.maxes, time)
+		if i == len(self.maxes):
+			return False
+		blk = self.blocks[i]
+		pos = bisect_left(blk, time)
+		return blk[pos] == time
+
+	def tolist(self):
+		return [time for blk in self.blocks for time in blk]
+
+	def add(self, time):
+		"""
+		Insert time
+		Return: False if it was already there
+		"""
+		maxes = self.maxes
+		if not maxes:
+			self.blocks.append([time])
+			maxes.append(time)
+			self.size = 1
+			return True
+		i = bisect_left(maxes, time)
+		if i == len(maxes):
+			# Past the last event, appended to the last block
+			i -= 1
+		blk = self.blocks[i]
+		pos = bisect_left(blk, time)
+		if pos < len(blk) and blk[pos] == time:
+			return False
+		blk.insert(pos, time)
+		maxes[i] = blk[-1]
+		self.size += 1
+		load = DREventList.LOAD
+		if len(blk) > 2 * load:
+			# Split the full block in halves
+			self.blocks[i:i+1] = [blk[:load], blk[load:]]
+			maxes[i:i+1] = [blk[load-1], blk[-1]]
+		return True
+
+	def remove(self, time):
+		"""
+		Remove time, which must be there
+		"""
+		i = bisect_left(self.maxes, time)
+		blk = self.blocks[i] if i < len(self.maxes) else []
+		pos = bisect_left(blk, time)
+		if pos == len(blk) or blk[pos] != time:
+			raise ValueError('%r is not an event' % (time))
+		del blk[pos]
+		self.size -= 1
+		if blk:
+			self.maxes[i] = blk[-1]
+		else:
+			del self.blocks[i]
+			del self.maxes[i]
+
+	def prune(self, time):
+		"""
+		Drop every event before time
+		"""
+		i = bisect_left(self.maxes, time)
+		if i:
+			self.size -= sum(len(blk) for blk in self.blocks[:i])
+			del self.blocks[:i]
+			del self.maxes[:i]
+		if self.blocks:
+			blk = self.blocks[0]
+			pos = bisect_left(blk, time)
+			del blk[:pos]
+			self.size -= pos
+
+	def irange(self, st, ed = float('inf')):
+		"""
+		Generate the events in (st, ed] in order; the list must not change meanwhile
+		"""
+		i = bisect_right(self.maxes, st)
+		if i == len(self.maxes):
+			return
+		blocks = self.blocks
+		blk = blocks[i]
+		pos = bisect_right(blk, st)
+		while True:
+			for j in xrange(pos, len(blk)):
+				time = blk[j]
+				if time > ed:
+					return
+				yield time
+			i += 1
+			if i == len(blocks):
+				return
+			blk = blocks[i]
+			pos = 0
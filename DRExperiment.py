@@ -0,0 +1,111 @@
+#####################################################
+#
+# Experiment runner for independent scheduling trials
+#
+#####################################################
+
+import multiprocessing
+import numpy
+
+from DRCommon import *
+from DRTopo import *
+from DRRequest import *
+from DRScheduler import *
+
+# Scheduler owned by the current worker process
+worker_sch = None
+
+def DRInitWorker(k, attr = None, profile = None, profile_dir = None):
+	"""
+	Pool initializer: every worker builds its own topology and scheduler once
+		attr: link attributes of the fattree, see DRTopo.FatTree
+		profile: DRProfiler mode to profile the runs of the worker into profile_dir, None not to
+	"""
+	global worker_sch
+	logger = DRLogger()
+	logger.level = DRLogger.SILENT
+	worker_sch = DRScheduler(DRTopo.FatTree(k, attr), logger = logger)
+	if profile != None:
+		worker_sch.enableProfile(DRProfiler(profile, profile_dir))
+
+def DRRunTrial(task):
+	"""
+	Run one algorithm on one trial.
+	Input:
+		task: (trial, alg, seed, num_req, flow_num)
+	Output:
+		(trial, alg, succeeded number, failed number, number of fully admitted requests)
+	"""
+	trial, alg, seed, num_req, flow_num = task
+	# The requests and any random choice of the algorithm only depend on the trial seed
+	numpy.random.seed(seed)
+	hosts = sorted(worker_sch.topo.layer[DRCommon.HOST])
+	req_lst = [DRRequest.QueryAggr(hosts, flow_num = flow_num) for i in xrange(num_req)]
+	succ_lst, fail_lst = getattr(worker_sch, alg)(req_lst)
+	full, part, none = DRScheduler.requestStats(req_lst, succ_lst)
+	return trial, alg, len(succ_lst), len(fail_lst), full
+
+
+class DRExperiment(DRCommon):
+	"""
+	Independent trials of the scheduling algorithms on a k-ary fattree, fanned out over a process pool.
+		attr: link attributes of the fattree, see DRTopo.FatTree; e.g. {'core_bw':0.05} makes the core links the
+			bottleneck, the workload where DROfflineMultiPath gains over DROfflineSinglePath
+		test_num: number of trials, trial i being seeded with seed + i
+		num_req/flow_num: QueryAggr requests per trial and flows per request
+		algs: DRScheduler methods to compare
+		procs: worker processes, default to the number of cores, 1 to run in this process
+		profile: DRProfiler mode (DRProfiler.PROFILE or DRProfiler.SAMPLE) to profile every run of the profiled
+			entry points into profile_dir, None not to; see profileReport()
+	"""
+
+	ALGORITHMS	= ['DROfflineNoValuation', 'DROnlineNoValuation', 'ECMPOffline', 'DROfflineAllOrNothing',
+					'DROfflineMultiPath', 'DROfflineSinglePath']
+
+	def __init__(self, k = 4, test_num = 50, num_req = 40, flow_num = 20, seed = 0, algs = None, procs = None,
+				profile = None, profile_dir = 'profiles', attr = None):
+		self.k = k
+		self.attr = attr
+		self.test_num = test_num
+		self.num_req = num_req
+		self.flow_num = flow_num
+		self.seed = seed
+		self.algs = algs if algs != None else DRExperiment.ALGORITHMS
+		self.procs = procs if procs != None else multiprocessing.cpu_count()
+		self.profile = profile
+		self.profile_dir = profile_dir
+
+	def tasks(self):
+		return [(i, alg, self.seed + i, self.num_req, self.flow_num) for i in xrange(self.test_num) for alg in self.algs]
+
+	def run(self):
+		"""
+		Output:
+			alg -> (average succeeded number, average failed number, average number of fully admitted requests)
+		"""
+		if self.procs > 1:
+			pool = multiprocessing.Pool(self.procs, DRInitWorker, (self.k, self.attr, self.profile, self.profile_dir))
+			try:
+				res_lst = pool.map(DRRunTrial, self.tasks(), chunksize = 1)
+			finally:
+				pool.close()
+				pool.join()
+		else:
+			DRInitWorker(self.k, self.attr, self.profile, self.profile_dir)
+			res_lst = [DRRunTrial(task) for task in self.tasks()]
+
+		succ_cum = {alg:0 for alg in self.algs}
+		fail_cum = {alg:0 for alg in self.algs}
+		req_cum = {alg:0 for alg in self.algs}
+		for trial, alg, succ, fail, full in res_lst:
+			succ_cum[alg] += succ
+			fail_cum[alg] += fail
+			req_cum[alg] += full
+		n = float(self.test_num)
+		return {alg:(succ_cum[alg] / n, fail_cum[alg] / n, req_cum[alg] / n) for alg in self.algs}
+
+	def profileReport(self, top = 20):
+		"""
+		Return: text lines of the runs profiled into profile_dir and their hot functions, see DRProfiler.report()
+		"""
+		return DRProfiler.report(DRProfiler.files(self.profile_dir), top)
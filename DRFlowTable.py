@@ -0,0 +1,114 @@
+#####################################################
+#
+# Columnar flow tables for large batches
+#
+#####################################################
+
+import numpy
+
+from DRCommon import *
+
+class DRFlowTable(DRCommon):
+	"""
+	Batch of flows as one NumPy structured array instead of (s, t, f, a, d) tuples.
+		flows: records of DTYPE, src/dst being node ids into names
+		names: node id -> node name
+	The scheduling entry points take a table in place of a request list and answer with a DRFlowResult.
+	"""
+
+	DTYPE = numpy.dtype([('src', numpy.int32), ('dst', numpy.int32), ('size', numpy.float64),
+						('arrival', numpy.float64), ('deadline', numpy.float64), ('req', numpy.int32)])
+
+	# Orders of the flows
+	BY_SIZE			= 0		# size
+	BY_ARRIVAL		= 1		# arriving time, then end time
+	BY_ARRIVAL_SIZE	= 2		# arriving time, then size
+
+	def __init__(self, flows, names):
+		self.flows = flows
+		self.names = names
+		# Plain lists for the per-flow accesses of the routing loop
+		self.cols = None
+
+	def __len__(self):
+		return len(self.flows)
+
+	@staticmethod
+	def fromReqLst(req_lst, names):
+		"""
+		Build a table from [[(s, t, f, a, d), ...], ...], numbering nodes as in names
+		"""
+		ids = {v:i for i, v in enumerate(names)}
+		flow_lst = [(ids[s], ids[t], f, a, d, i) for i, req in enumerate(req_lst) for s, t, f, a, d in req]
+		return DRFlowTable(numpy.array(flow_lst, dtype=DRFlowTable.DTYPE), names)
+
+	@staticmethod
+	def fromBatch(flows, host_lst):
+		"""
+		Build a table from the DRRequest.FLOW_DTYPE records of a batch generator, host_lst naming the host indices
+		"""
+		table = numpy.empty(len(flows), dtype=DRFlowTable.DTYPE)
+		for col in ('src', 'dst', 'size', 'arrival', 'deadline', 'req'):
+			table[col] = flows[col]
+		return DRFlowTable(table, host_lst)
+
+	def order(self, key):
+		"""
+		Return: index array of the flows sorted by key, stable for equal keys
+		"""
+		fl = self.flows
+		if key == DRFlowTable.BY_SIZE:
+			return numpy.argsort(fl['size'], kind='mergesort')
+		elif key == DRFlowTable.BY_ARRIVAL:
+			return numpy.lexsort((fl['arrival'] + fl['deadline'], fl['arrival']))
+		elif key == DRFlowTable.BY_ARRIVAL_SIZE:
+			return numpy.lexsort((fl['size'], fl['arrival']))
+		return numpy.arange(len(fl))
+
+	def flow(self, i):
+		"""
+		Return: flow i as the (s, t, f, a, d) tuple used by the routing routines
+		"""
+		if self.cols == None:
+			self.cols = [self.flows[col].tolist() for col in ('src', 'dst', 'size', 'arrival', 'deadline')]
+		src, dst, size, arr, dl = self.cols
+		return (self.names[src[i]], self.names[dst[i]], size[i], arr[i], dl[i])
+
+
+class DRFlowResult(DRCommon):
+	"""
+	Columnar outcome of scheduling a DRFlowTable.
+		admitted: boolean mask over the flows of the table
+		finish_time: finish time of each admitted flow, NaN otherwise
+		path_id: index into paths of the path of each admitted flow, -1 otherwise
+		paths: distinct paths, each being stored once
+	"""
+
+	def __init__(self, table):
+		n = len(table)
+		self.table = table
+		self.admitted = numpy.zeros(n, dtype=bool)
+		self.finish_time = numpy.full(n, numpy.nan)
+		self.path_id = numpy.full(n, -1, dtype=numpy.int32)
+		self.paths = []
+		self.path_idx = {}
+
+	def record(self, i, path, finish_time):
+		"""
+		Record flow i as admitted on path, or on a list of paths for a split flow
+		"""
+		key = tuple(tuple(p) if type(p) == list else p for p in path)
+		pid = self.path_idx.get(key)
+		if pid == None:
+			pid = len(self.paths)
+			self.path_idx[key] = pid
+			self.paths.append(path)
+		self.admitted[i] = True
+		self.finish_time[i] = finish_time
+		self.path_id[i] = pid
+
+	def succIdx(self):
+		return numpy.flatnonzero(self.admitted)
+
+	def failIdx(self):
+		return numpy.flatnonzero(~self.admitted)
@@ -0,0 +1,264 @@
+#####################################################
+#
+# LP relaxation bounding the offline acceptance
+#
+#####################################################
+
+import time
+import numpy
+import scipy.sparse
+import scipy.sparse.csgraph
+import scipy.optimize
+
+from DRCommon import *
+from DRFlowTable import *
+
+class DRLPBound(DRCommon):
+	"""
+	Time-expanded multi-commodity flow LP over the residual capacities of a scheduler.
+	Maximize the number of admitted flows, x[i] in [0, 1] being the admitted fraction of flow i:
+		demand:			sum_j y[i, j] = size[i] * x[i], y[i, j] being the volume of flow i sent in interval j
+		conservation:	per destination t, interval j and node v != t, out volume - in volume = volume injected at v
+		capacity:		per edge and interval, the volume towards every destination <= residual capacity area
+	Flows towards the same destination are merged into one commodity, and flows may split over any path and rate,
+	so every schedule delivering each admitted flow within the residual capacities is feasible here and the optimum
+	bounds its acceptance from above. The heuristics may exceed it where their allocations overbook a link or,
+	trimmed by DRAllocTrim, cover less than the flow size.
+	The intervals are cut at the arriving times, end times and events of the scheduler. Beyond max_intervals
+	neighbouring intervals are merged, each flow then using every interval overlapping its time window, which
+	loosens the bound but keeps it valid.
+	Merging switches into one node, their parallel links into one of the summed capacity, also only adds schedules,
+	and shrinks the commodities that otherwise span every link of the topology:
+		MERGE_NONE:	the topology as it is
+		MERGE_CORE:	the core switches (layer CORE) into one node
+		MERGE_POD:	also each group of the other switches linked without the core, i.e. a fattree pod (default)
+	The host links stay as they are, so the incast bottlenecks of the receivers and senders are kept exactly.
+	Hosts are assumed single-homed, as in DRTopo.FatTree and DRTopo.LeafSpine: no simple path relays through a host,
+	so each commodity only gets the switch-to-switch edges, the uplinks of its senders and the downlinks into its
+	destination. With multi-homed hosts the paths relayed through them are left out and the bound may not hold.
+		sch: DRScheduler whose current state gives the residual capacities
+		table: DRFlowTable of the flows
+		merge: merge level, default to DEF_MERGE
+	"""
+
+	DEF_MAX_INTERVALS	= 16
+	# Merge levels
+	MERGE_NONE	= 0
+	MERGE_CORE	= 1
+	MERGE_POD	= 2
+	DEF_MERGE	= MERGE_POD
+
+	def __init__(self, sch, table, max_intervals = None, merge = None):
+		if max_intervals == None:
+			max_intervals = DRLPBound.DEF_MAX_INTERVALS
+		self.sch = sch
+		self.table = table
+		self.max_intervals = max_intervals
+		if merge == None:
+			merge = DRLPBound.DEF_MERGE
+		self.merge = merge
+		# Filled by solve()
+		self.bound = None
+		self.accept = None
+		self.status = None
+		self.message = None
+		self.build_time = None
+		self.solve_time = None
+		self.var_num = 0
+		self.row_num = 0
+		self.edge_num = 0
+
+	def breakpoints(self):
+		"""
+		Return: sorted interval boundaries, at most max_intervals + 1 of them
+		"""
+		fl = self.table.flows
+		st = fl['arrival']
+		ed = fl['arrival'] + fl['deadline']
+		if len(fl) == 0:
+			return numpy.zeros(1)
+		lo = st.min(); hi = ed.max()
+		ev = numpy.array(list(self.sch.event_lst.irange(lo, hi)), dtype=float)
+		ev = ev[ev < hi]
+		bp = numpy.unique(numpy.concatenate((st, ed, ev)))
+		if len(bp) - 1 > self.max_intervals:
+			bp = bp[numpy.unique(numpy.round(numpy.linspace(0, len(bp) - 1, self.max_intervals + 1)).astype(int))]
+		return bp
+
+	def capacity(self, csr, bp):
+		"""
+		Return: residual capacity area of each edge (rows) in each interval (columns)
+		"""
+		cap = numpy.zeros((csr.edge_num, len(bp) - 1))
+		ext = bp[-1] + 1
+		for eid in xrange(csr.edge_num):
+			times, rates = self.sch.rate_lst[csr.edge(eid)].arrays()
+			# Cumulative area at each breakpoint, the infinite one being moved past the last interval
+			times = numpy.minimum(times, max(ext, times[-2] + 1 if len(times) > 1 else ext))
+			cum = numpy.zeros(len(times))
+			numpy.cumsum(rates[:-1] * numpy.diff(times), out=cum[1:])
+			cap[eid] = numpy.diff(numpy.interp(bp, times, cum))
+		# Overbooked residuals count as no capacity
+		return numpy.maximum(cap, 0)
+
+	def mergeEdges(self, csr, cap):
+		"""
+		Merge the switches as the merge level says, and the parallel links this gives into one of their summed capacity
+		Output:
+			(src, dst, cap) of the edges between the merged nodes, each node being named by its smallest id
+		"""
+		n = csr.node_num
+		src = csr.src.astype(numpy.int64)
+		dst = csr.dst.astype(numpy.int64)
+		if self.merge == DRLPBound.MERGE_NONE:
+			return src, dst, cap
+		node = numpy.arange(n)
+		core = numpy.flatnonzero(csr.layer == DRCommon.CORE)
+		if len(core):
+			node[core] = core[0]
+		if self.merge == DRLPBound.MERGE_POD:
+			# Pods: the groups of the other switches linked without going through the core
+			sw = (csr.layer != DRCommon.HOST) & (csr.layer != DRCommon.CORE)
+			inner = sw[src] & sw[dst]
+			g = scipy.sparse.coo_matrix((numpy.ones(inner.sum()), (src[inner], dst[inner])), shape=(n, n))
+			comp_num, label = scipy.sparse.csgraph.connected_components(g, connection='weak')
+			first = numpy.full(comp_num, n, dtype=numpy.int64)
+			numpy.minimum.at(first, label, numpy.arange(n))
+			node[sw] = first[label[sw]]
+		src = node[src]; dst = node[dst]
+		keep = src != dst
+		key, inv = numpy.unique(src[keep] * n + dst[keep], return_inverse=True)
+		merged = numpy.zeros((len(key), cap.shape[1]))
+		numpy.add.at(merged, inv, cap[keep])
+		return key // n, key % n, merged
+
+	def build(self):
+		"""
+		Output:
+			(c, A_ub, b_ub, A_eq, b_eq) with sparse matrices
+		"""
+		csr = self.sch.topo.compile()
+		fl = self.table.flows
+		ids = csr.ids
+		names = self.table.names
+		n = len(fl)
+		src = numpy.array([ids[names[v]] for v in fl['src'].tolist()], dtype=numpy.int64)
+		dst = numpy.array([ids[names[v]] for v in fl['dst'].tolist()], dtype=numpy.int64)
+		size = fl['size'].astype(float)
+
+		bp = self.breakpoints()
+		J = len(bp) - 1
+		e_src, e_dst, cap = self.mergeEdges(csr, self.capacity(csr, bp))
+		self.intervals = bp
+		self.edge_num = len(e_src)
+
+		# Window of each flow: intervals [j0, j1) overlapping [arrival, arrival + deadline]
+		j0 = numpy.clip(numpy.searchsorted(bp, fl['arrival'], 'right') - 1, 0, J)
+		j1 = numpy.clip(numpy.searchsorted(bp, fl['arrival'] + fl['deadline'], 'left'), 0, J)
+		j1 = numpy.maximum(j1, j0)
+		win = j1 - j0
+
+		rows = []; cols = []; vals = []
+		# Variables: x, then y per flow and interval of its window, then z per destination, interval and edge
+		y_base = n
+		y_ptr = numpy.zeros(n + 1, dtype=numpy.int64)
+		numpy.cumsum(win, out=y_ptr[1:])
+		z_base = y_base + y_ptr[-1]
+
+		# Demand rows 0 ... n-1
+		rows.append(numpy.arange(n)); cols.append(numpy.arange(n)); vals.append(-size)
+		y_flow = numpy.repeat(numpy.arange(n), win)
+		rows.append(y_flow); cols.append(y_base + numpy.arange(y_ptr[-1])); vals.append(numpy.ones(y_ptr[-1]))
+
+		# Conservation rows per destination, interval and node, then capacity rows per edge and interval
+		is_host = csr.layer == DRCommon.HOST
+		core_edge = numpy.flatnonzero(~is_host[e_src] & ~is_host[e_dst])
+		dests = numpy.unique(dst)
+		row_base = n
+		z_num = 0
+		cap_rows = []; cap_cols = []
+		for t in dests.tolist():
+			grp = numpy.flatnonzero(dst == t)
+			g0 = j0[grp].min(); g1 = j1[grp].max()
+			if g1 <= g0:
+				continue
+			# Edges a flow towards t may use without a cycle: between switches, up from its senders, down into t
+			up = numpy.flatnonzero(numpy.in1d(e_src, src[grp]) & is_host[e_src] & ~is_host[e_dst])
+			down = numpy.flatnonzero((e_dst == t) & is_host[e_dst] & ~is_host[e_src])
+			edges = numpy.concatenate((core_edge, up, down))
+			E = len(edges); G = g1 - g0
+			zid = z_base + z_num + numpy.arange(G * E)
+			jj = numpy.repeat(numpy.arange(G), E)
+			ee = numpy.tile(edges, G)
+			u = e_src[ee]; v = e_dst[ee]
+			# Out of u, into v, no row for t itself
+			out = u != t
+			rows.append(row_base + jj[out] * csr.node_num + u[out]); cols.append(zid[out]); vals.append(numpy.ones(out.sum()))
+			inn = v != t
+			rows.append(row_base + jj[inn] * csr.node_num + v[inn]); cols.append(zid[inn]); vals.append(-numpy.ones(inn.sum()))
+			# Volume injected at the senders
+			for i in grp.tolist():
+				if src[i] == t:
+					continue
+				k = numpy.arange(win[i])
+				rows.append(row_base + (j0[i] + k - g0) * csr.node_num + src[i])
+				cols.append(y_base + y_ptr[i] + k); vals.append(-numpy.ones(win[i]))
+			cap_rows.append(ee * J + g0 + jj); cap_cols.append(zid)
+			row_base += G * csr.node_num
+			z_num += G * E
+
+		var_num = z_base + z_num
+		A_eq = scipy.sparse.coo_matrix((numpy.concatenate(vals), (numpy.concatenate(rows), numpy.concatenate(cols))),
+										shape=(row_base, var_num)).tocsr()
+		# Drop the rows of the nodes no commodity goes through
+		A_eq = A_eq[numpy.flatnonzero(numpy.diff(A_eq.indptr))]
+		b_eq = numpy.zeros(A_eq.shape[0])
+
+		if cap_rows:
+			cap_rows = numpy.concatenate(cap_rows); cap_cols = numpy.concatenate(cap_cols)
+			used, cap_rows = numpy.unique(cap_rows, return_inverse=True)
+		else:
+			cap_cols = used = numpy.zeros(0, dtype=numpy.int64)
+			cap_rows = cap_cols
+		A_ub = scipy.sparse.coo_matrix((numpy.ones(len(cap_cols)), (cap_rows, cap_cols)), shape=(len(used), var_num)).tocsr()
+		b_ub = cap.reshape(-1)[used]
+
+		c = numpy.zeros(var_num)
+		c[:n] = -1
+		self.var_num = var_num
+		self.row_num = A_eq.shape[0] + A_ub.shape[0]
+		return c, A_ub, b_ub, A_eq, b_eq
+
+	def solve(self):
+		"""
+		Build and solve the LP with the interior-point method of SciPy
+		Output:
+			bound: maximum (fractional) number of flows admitted, None if the solver failed
+		"""
+		n = len(self.table)
+		t = time.time()
+		c, A_ub, b_ub, A_eq, b_eq = self.build()
+		self.build_time = time.time() - t
+
+		bounds = [(0, 1)] * n + [(0, None)] * (self.var_num - n)
+		t = time.time()
+		res = scipy.optimize.linprog(c, A_ub = A_ub if A_ub.shape[0] else None, b_ub = b_ub if A_ub.shape[0] else None,
+									A_eq = A_eq, b_eq = b_eq, bounds = bounds, method = 'interior-point',
+									options = {'sparse':True, 'presolve':False})
+		self.solve_time = time.time() - t
+		self.status = res.status
+		self.message = res.message
+		if res.status != 0:
+			return None
+		self.accept = numpy.clip(res.x[:n], 0, 1)
+		self.bound = float(-res.fun)
+		return self.bound
+
+	def upper(self):
+		"""
+		Return: integer upper bound on the number of flows any schedule admits
+		"""
+		if self.bound == None:
+			return None
+		# Round down, tolerating the solver accuracy
+		return int(numpy.floor(self.bound + 1e-6))
@@ -7,39 +7,172 @@
 from DRCommon import *
 import sys
 import copy
+import json
+import threading
+import Queue
+
+class DRAsyncSink(DRCommon):
+	"""
+	File-like sink handing the writes to a background thread through a bounded queue.
+	Writers block once queue_size writes are pending, so a slow disk slows the run down instead of growing memory.
+	Once a write fails the thread drops the writes still coming, and the error is raised again by write() and close().
+	"""
+
+	DEF_QUEUE_SIZE	= 4096
+
+	def __init__(self, out, queue_size = None):
+		if queue_size == None:
+			queue_size = DRAsyncSink.DEF_QUEUE_SIZE
+		self.out = out
+		self.queue = Queue.Queue(queue_size)
+		self.error = None
+		self.closed = False
+		self.thread = threading.Thread(target = self.run)
+		self.thread.daemon = True
+		self.thread.start()
+
+	def run(self):
+		while True:
+			s = self.queue.get()
+			if s == None:
+				break
+			if self.error != None:
+				# Keep draining so that the writers never block on a dead sink
+				continue
+			try:
+				self.out.write(s)
+			except Exception as ex:
+				self.error = ex
+		if self.error == None:
+			try:
+				self.out.flush()
+			except Exception as ex:
+				self.error = ex
+
+	def write(self, s):
+		if self.error != None:
+			raise self.error
+		self.queue.put(s)
+
+	def flush(self):
+		# Pending writes are written in order, the underlying file is flushed on close()
+		pass
+
+	def close(self):
+		"""
+		Write what is pending, stop the thread and close the file
+			Raise: the error of a failed write, if any
+		"""
+		if self.thread.is_alive():
+			self.queue.put(None)
+			self.thread.join()
+		if not self.closed:
+			self.closed = True
+			self.out.close()
+		if self.error != None:
+			raise self.error
+
 
 class DRLogger(DRCommon):
 	"""
 	Logger
+		file: None for stdout, a file name, or a DRLogger to share the sinks of
+		records: file name to write the per-flow decision records to, as JSON lines
+		background: write the files from a background thread instead of the caller
+	Messages can be a format string with its arguments, given to logf() or info()/debug()/all(),
+	or a function returning the message, either being formatted only if the level lets the message through.
+	Files are buffered, call close() (or flush()) once done, which background writing needs to finish.
 	"""
 	SILENT	= -1
 	INFO	= 0
 	DEBUG 	= 1
 	ALL		= 2
 
-	def __init__(self, file = None):
+	def __init__(self, file = None, records = None, background = False):
 		self.level = DRLogger.INFO
+		self.rec_out = None
 
 		if file == None:
 			self.out = sys.stdout
 		elif type(file) == str:
-			self.out = open(file, 'w', 0)
+			self.out = open(file, 'w')
 		elif type(file) == DRLogger:
 			self.out = file.out
 			self.level = file.level
+			self.rec_out = file.rec_out
 
+		if records != None:
+			self.rec_out = open(records, 'w')
+		if background:
+			if self.out != sys.stdout and not isinstance(self.out, DRAsyncSink):
+				self.out = DRAsyncSink(self.out)
+			if self.rec_out != None and not isinstance(self.rec_out, DRAsyncSink):
+				self.rec_out = DRAsyncSink(self.rec_out)
 
+	def enabled(self, level = INFO):
+		return self.level >= level and self.level >= 0 and level >= 0
 
 	def log(self, msg, level = INFO):
 		if self.level >= level and self.level >= 0 and level >= 0:
 			# E.g. when system level is DEBUG and information to display is INFO
+			if callable(msg):
+				msg = msg()
 			self.out.write(msg+'\n')
 
-	def info(self, msg):
-		self.log(msg, level = DRLogger.INFO)
+	def logf(self, level, msg, *args):
+		"""
+		Log msg % args, formatted only if the level lets the message through
+		"""
+		if self.level >= level and self.level >= 0 and level >= 0:
+			self.log(msg % args if args else msg, level)
+
+	def info(self, msg, *args):
+		self.logf(DRLogger.INFO, msg, *args)
+
+	def debug(self, msg, *args):
+		self.logf(DRLogger.DEBUG, msg, *args)
+
+	def all(self, msg, *args):
+		self.logf(DRLogger.ALL, msg, *args)
+
+	def record(self, rec):
+		"""
+		Write one record, a dict, as a compact JSON line if records are on
+		"""
+		if self.rec_out != None:
+			self.rec_out.write(json.dumps(rec, separators = (',', ':')) + '\n')
+
+	def decision(self, flow, res, retries = 0):
+		"""
+		Record the decision on one flow
+			res: (flow, path, rate_alloc, finish_time) if admitted, None otherwise
+		"""
+		if self.rec_out == None:
+			return
+		rec = {'s':flow[0], 't':flow[1], 'f':flow[2], 'a':flow[3], 'd':flow[4], 'ok':res != None, 'retries':retries}
+		if res != None:
+			rec['path'] = res[1]
+			rec['finish'] = res[3]
+		self.record(rec)
 
-	def debug(self, msg):
-		self.log(msg, level = DRLogger.DEBUG)
+	def flush(self):
+		self.out.flush()
+		if self.rec_out != None:
+			self.rec_out.flush()
 
-	def all(self, msg):
-		self.log(msg, level = DRLogger.ALL)
+	def close(self):
+		"""
+		Flush and close the files of this logger, leaving stdout open
+			Raise: the first error met, once every file is closed
+		"""
+		error = None
+		for out in (self.out, self.rec_out):
+			if out == None or out == sys.stdout:
+				continue
+			try:
+				out.close()
+			except Exception as ex:
+				if error == None:
+					error = ex
+		if error != None:
+			raise error
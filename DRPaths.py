@@ -0,0 +1,554 @@
+#####################################################
+#
+# Path providers and caches sparing the routing searches
+#
+#####################################################
+
+from collections import OrderedDict
+from heapq import heappush, heappop
+
+from DRCommon import *
+
+class DRFatTreePaths(DRCommon):
+	"""
+	Closed-form equal-cost shortest paths between the hosts of a k-ary fattree built by DRTopo.FatTree.
+	The host names H-pod-edge-host determine the paths:
+		same host:		[s]
+		same edge:		[s, E, t]
+		same pod:		[s, E, A, E', t] through each of the k/2 aggregation switches of the pod
+		across pods:	[s, E, A, C, A', E', t] through each of the (k/2)^2 core switches
+	Aggregation switch A-pod-j connects to core switches C-(j*k/2) ... C-(j*k/2+k/2-1).
+	"""
+
+	def __init__(self, k):
+		self.k = k
+		half = k / 2
+		# Switch names, formatted once
+		self.edge = [['E-{0}-{1}'.format(i, j) for j in xrange(half)] for i in xrange(k)]
+		self.aggr = [['A-{0}-{1}'.format(i, j) for j in xrange(half)] for i in xrange(k)]
+		self.core = [['C-{0}'.format(j*half+l) for l in xrange(half)] for j in xrange(half)]
+
+	def locate(self, host):
+		"""
+		Return: (pod, edge) of a host, or None if it is not a fattree host
+		"""
+		s = host.split('-')
+		if len(s) != 4 or s[0] != 'H':
+			return None
+		try:
+			pod = int(s[1]); edge = int(s[2])
+		except ValueError:
+			return None
+		if pod >= self.k or edge >= self.k / 2:
+			return None
+		return pod, edge
+
+	def paths(self, s, t, edge_mark = None):
+		"""
+		Generate the shortest paths from s to t skipping those using a marked edge.
+		Input:
+			edge_mark: a edge is not counted in if marked as True, None for no marks
+		Output:
+			generator of paths [s, v1, v2, ..., t]; None if s or t is not a fattree host
+		"""
+		ls = self.locate(s)
+		lt = self.locate(t)
+		if ls == None or lt == None:
+			return None
+		return self.genPaths(s, t, ls, lt, edge_mark)
+
+	def genPaths(self, s, t, ls, lt, edge_mark):
+		if s == t:
+			yield [s]
+			return
+		mark = edge_mark if edge_mark != None else {}
+		es = self.edge[ls[0]][ls[1]]
+		et = self.edge[lt[0]][lt[1]]
+		if mark.get((s, es)) or mark.get((et, t)):
+			return
+		if ls == lt:
+			yield [s, es, t]
+			return
+
+		for j in xrange(self.k / 2):
+			a_s = self.aggr[ls[0]][j]
+			a_t = self.aggr[lt[0]][j]
+			if mark.get((es, a_s)) or mark.get((a_t, et)):
+				continue
+			if ls[0] == lt[0]:
+				yield [s, es, a_s, et, t]
+				continue
+			for c in self.core[j]:
+				if mark.get((a_s, c)) or mark.get((c, a_t)):
+					continue
+				yield [s, es, a_s, c, a_t, et, t]
+
+
+class DRPathCache(DRCommon):
+	"""
+	LRU cache of the equal-cost shortest paths of a DRTopo.
+		dag(t): per-destination shortest-path DAG from one reverse BFS, shared by every sender towards t
+		ecmp(s, t): all shortest paths from s to t, taken from the DAG of t
+	Both tables hold at most size entries and are dropped as soon as the topology version changes,
+	i.e. whenever DRTopo.init() is re-run, which removing links does.
+	Cached paths are shared, callers must not modify them.
+	"""
+
+	DEF_SIZE	= 4096
+
+	def __init__(self, topo, size = None):
+		self.topo = topo
+		if size == None:
+			size = DRPathCache.DEF_SIZE
+		self.size = size
+		# Number of DAGs built, i.e. of reverse BFS passes
+		self.builds = 0
+		self.clear()
+
+	def clear(self):
+		self.version = self.topo.version
+		self.dag_tbl = OrderedDict()
+		self.path_tbl = OrderedDict()
+
+	def lookup(self, tbl, key):
+		if self.version != self.topo.version:
+			self.clear()
+			return None
+		val = tbl.pop(key, None)
+		if val != None:
+			# Re-insert as the most recently used
+			tbl[key] = val
+		return val
+
+	def store(self, tbl, key, val):
+		tbl[key] = val
+		if len(tbl) > self.size:
+			tbl.popitem(last = False)
+
+	def dag(self, t):
+		"""
+		Shortest-path DAG towards t
+		Output:
+			d: node -> hop count to t, for the nodes that can reach t
+			nxt: node -> list of next hops on a shortest path to t
+		"""
+		res = self.lookup(self.dag_tbl, t)
+		if res != None:
+			return res
+
+		self.builds += 1
+		g = self.topo.topo
+		d = {t:0}
+		nxt = {t:[]}
+		# Reverse BFS from t over the incoming edges
+		queue = [t]; hdr = 0
+		while hdr < len(queue):
+			v = queue[hdr]
+			hdr += 1
+			for u in g.predecessors(v):
+				if u not in d:
+					d[u] = d[v] + 1
+					nxt[u] = [v]
+					queue.append(u)
+				elif d[u] == d[v] + 1:
+					nxt[u].append(v)
+
+		res = (d, nxt)
+		self.store(self.dag_tbl, t, res)
+		return res
+
+	def ecmp(self, s, t):
+		"""
+		Output:
+			p_lst: a list of paths [[s, v11, v12, ..., t], [s, v21, v22, ..., t]], empty if t cannot be reached
+		"""
+		p_lst = self.lookup(self.path_tbl, (s, t))
+		if p_lst != None:
+			return p_lst
+
+		d, nxt = self.dag(t)
+		p_lst = []
+		if s in d:
+			# Parents on the DAG in the order a BFS from s would append them, so that the paths
+			# come in the order of DRScheduler.ECMPPaths, which ECMP's random pick depends on
+			succ = self.topo.topo.succ
+			pa = {s:[]}
+			queue = [s]; hdr = 0
+			while hdr < len(queue):
+				u = queue[hdr]
+				hdr += 1
+				du = d[u] - 1
+				for v in succ[u]:
+					if d.get(v) != du:
+						continue
+					if v not in pa:
+						pa[v] = [u]
+						queue.append(v)
+					else:
+						pa[v].append(u)
+			# Depth-first over the parent lists from t back to s, first parents first
+			stack = [(t, [t])]
+			while stack:
+				v, p = stack.pop()
+				if v == s:
+					p.reverse()
+					p_lst.append(p)
+					continue
+				for u in reversed(pa[v]):
+					stack.append((u, p + [u]))
+
+		self.store(self.path_tbl, (s, t), p_lst)
+		return p_lst
+
+
+class DRReRouter(DRCommon):
+	"""
+	Min-hop path search from s to t keeping its BFS state between re-routing attempts.
+	Removing an edge only repairs the distances and parents of the nodes behind it (decremental BFS)
+	instead of searching again from s.
+	Each node keeps all its min-hop parents, and path() follows the one DRBFS would have taken, the first in BFS order,
+	so the paths are those of a new search from s whatever order the repairs left the parents in.
+		g: networkx DiGraph
+		edge_mark: edges marked as True beforehand are not counted in
+	"""
+
+	def __init__(self, g, s, t, edge_mark = None):
+		self.succ = g.succ
+		self.pred = g.pred
+		self.mark = edge_mark
+		self.start(s, t)
+
+	def start(self, s, t):
+		self.s = s
+		self.t = t
+		self.removed = set()
+		# Position of each out-neighbor of a node, built on first use by path()
+		self.rank = {}
+		self.bfs()
+
+	def out(self, u):
+		"""
+		Return: list of (v, e) for the out-edges e = (u, v) of u, in neighbor order
+		"""
+		return [(v, (u, v)) for v in self.succ[u]]
+
+	def inc(self, v):
+		"""
+		Return: list of (u, e) for the in-edges e = (u, v) of v
+		"""
+		return [(u, (u, v)) for u in self.pred[v]]
+
+	def blocked(self, e):
+		return e in self.removed or (self.mark != None and self.mark.get(e))
+
+	def free(self, u):
+		"""
+		Return: list of (v, e) for the out-edges of u that are not blocked
+		"""
+		removed = self.removed
+		mark = self.mark if self.mark != None else {}
+		return [(v, (u, v)) for v in self.succ[u] if not mark.get((u, v)) and (u, v) not in removed]
+
+	def lookup(self, e):
+		"""
+		Return: the edge searched over for the edge e = (u, v) of node names, None if there is none
+		"""
+		return e
+
+	def ends(self, e):
+		return e
+
+	def names(self, p):
+		return p
+
+	def order(self, u):
+		"""
+		Return: out-neighbor -> position in the neighbor order of u
+		"""
+		r = self.rank.get(u)
+		if r == None:
+			r = self.rank[u] = {v:i for i, (v, e) in enumerate(self.out(u))}
+		return r
+
+	def bfs(self):
+		"""
+		Full BFS from s keeping every min-hop parent of each node
+		"""
+		s = self.s
+		d = {s:0}
+		pa = {s:[]}
+		queue = [s]; hdr = 0
+		while hdr < len(queue):
+			u = queue[hdr]
+			hdr += 1
+			for v, e in self.free(u):
+				if v not in d:
+					d[v] = d[u] + 1
+					pa[v] = [u]
+					queue.append(v)
+				elif d[v] == d[u] + 1:
+					pa[v].append(u)
+		self.d = d
+		self.pa = pa
+
+	def path(self):
+		"""
+		Output:
+			p: [s, v1, v2, ..., t], or False if t cannot be reached
+		"""
+		s = self.s; t = self.t
+		if t not in self.d:
+			return False
+		pa = self.pa
+		# A node enters the BFS queue after every node of its level whose first parent comes earlier, or is the same
+		# and lists it earlier; the queue position is thus the tuple of neighbor positions along the first parents
+		pos = {s:()}
+		first = {}
+		stack = [t]
+		while stack:
+			v = stack[-1]
+			if v in pos:
+				stack.pop()
+				continue
+			todo = [w for w in pa[v] if w not in pos]
+			if todo:
+				stack.extend(todo)
+				continue
+			stack.pop()
+			for w in pa[v]:
+				k = pos[w] + (self.order(w)[v],)
+				if v not in first or k < pos[v]:
+					pos[v] = k
+					first[v] = w
+		p = [t]; v = t
+		while v != s:
+			v = first[v]
+			p.append(v)
+		p.reverse()
+		return self.names(p)
+
+	def remove(self, e):
+		"""
+		Remove the edge e = (u, v) and repair the search state
+		"""
+		e = self.lookup(e)
+		if e == None:
+			return
+		u, v = self.ends(e)
+		d = self.d
+		pa = self.pa
+		self.removed.add(e)
+		if v not in pa or u not in pa[v]:
+			# Not on any min-hop path, nothing changes
+			return
+		pa[v].remove(u)
+		if pa[v]:
+			# Another parent keeps the distance of v
+			return
+
+		# Collect the nodes that lose every min-hop parent
+		aff = [v]; aff_set = set(aff); hdr = 0
+		while hdr < len(aff):
+			x = aff[hdr]
+			hdr += 1
+			for y, ey in self.out(x):
+				if y in aff_set or y not in pa or x not in pa[y]:
+					continue
+				pa[y].remove(x)
+				if not pa[y]:
+					aff.append(y)
+					aff_set.add(y)
+		for x in aff:
+			del d[x]
+			del pa[x]
+
+		# Recompute their distances from the unaffected nodes, Dijkstra-like since the start keys differ
+		heap = []
+		for x in aff:
+			cand = [d[w] + 1 for w, ew in self.inc(x) if w in d and not self.blocked(ew)]
+			if cand:
+				heappush(heap, (min(cand), x))
+		while heap:
+			dx, x = heappop(heap)
+			if x in d:
+				continue
+			d[x] = dx
+			for y, ey in self.free(x):
+				if y in aff_set and y not in d:
+					heappush(heap, (dx + 1, y))
+
+		# Rebuild the parents of the repaired nodes, which may also become parents of unaffected ones
+		for x in aff:
+			if x in d:
+				pa[x] = [w for w, ew in self.inc(x) if w in d and d[w] + 1 == d[x] and not self.blocked(ew)]
+		for x in aff:
+			if x not in d:
+				continue
+			for y, ey in self.free(x):
+				if y not in aff_set and y in d and d[x] + 1 == d[y]:
+					pa[y].append(x)
+
+
+class DRReRouterCompact(DRReRouter):
+	"""
+	DRReRouter on a DRCompactTopo, edge_mark being a DREdgeMark.
+	The search runs over node and edge ids, removed edges and paths are given in node names as for DRReRouter.
+	"""
+
+	def __init__(self, csr, s, t, edge_mark = None):
+		self.csr = csr
+		self.succ = csr.nbr
+		self.succ_edge = csr.nbr_edge
+		self.pred = csr.rnbr
+		self.pred_edge = csr.rnbr_edge
+		self.mark = edge_mark
+		self.start(csr.ids[s], csr.ids[t])
+
+	def out(self, u):
+		return zip(self.succ[u], self.succ_edge[u])
+
+	def inc(self, v):
+		return zip(self.pred[v], self.pred_edge[v])
+
+	def blocked(self, eid):
+		return eid in self.removed or (self.mark != None and self.mark.marked(eid))
+
+	def free(self, u):
+		removed = self.removed
+		if self.mark == None:
+			return [(v, e) for v, e in zip(self.succ[u], self.succ_edge[u]) if e not in removed]
+		# The stamps read inline, a call per edge being most of the cost of a search
+		stamp = self.mark.stamp
+		gen = self.mark.gen
+		return [(v, e) for v, e in zip(self.succ[u], self.succ_edge[u]) if stamp[e] != gen and e not in removed]
+
+	def lookup(self, e):
+		return self.csr.edge_id.get(e)
+
+	def ends(self, eid):
+		return int(self.csr.src[eid]), int(self.csr.dst[eid])
+
+	def names(self, p):
+		names = self.csr.names
+		return [names[v] for v in p]
+
+
+class DRSharedRouter(DRCommon):
+	"""
+	Min-hop path search from s to t walking the shortest-path DAG towards t (see DRPathCache.dag), which every flow
+	towards t shares, so a receiver fed by many senders costs one reverse BFS instead of one BFS per sender.
+	Removing an edge repairs the DAG as DRReRouter does on the reversed graph: only the nodes whose every next hop
+	went through the edge get new distances and next hops. The shared DAG is copied before the first such repair,
+	each next hop list only when it changes.
+		g: networkx DiGraph
+		dag: (d, nxt) of t on g with no edge removed
+		edge_mark: edges marked as True are not counted in; a marked edge met on the path is removed then
+	"""
+
+	def __init__(self, g, s, t, dag, edge_mark = None):
+		self.succ = g.succ
+		self.pred = g.pred
+		self.s = s
+		self.t = t
+		self.d, self.nxt = dag
+		self.mark = edge_mark
+		self.removed = set()
+		# Nodes whose next hop list is private, None while the whole DAG is the shared one
+		self.own = None
+
+	def blocked(self, u, v):
+		return (u, v) in self.removed or (self.mark != None and self.mark.get((u, v)))
+
+	def path(self):
+		"""
+		Output:
+			p: [s, v1, v2, ..., t] following the first next hops, or False if t cannot be reached
+		"""
+		mark = self.mark
+		while self.s in self.d:
+			nxt = self.nxt
+			p = [self.s]; v = self.s
+			while v != self.t:
+				w = nxt[v][0]
+				if mark != None and mark.get((v, w)) and (v, w) not in self.removed:
+					# Marked before the DAG was taken, repair it and walk again
+					self.remove((v, w))
+					break
+				p.append(w)
+				v = w
+			else:
+				return p
+		return False
+
+	def hops(self, x):
+		"""
+		Return: the next hop list of x, made private first
+		"""
+		if self.own == None:
+			self.d = dict(self.d)
+			self.nxt = dict(self.nxt)
+			self.own = set()
+		if x not in self.own:
+			self.nxt[x] = list(self.nxt[x])
+			self.own.add(x)
+		return self.nxt[x]
+
+	def remove(self, e):
+		"""
+		Remove the edge e = (u, v) and repair the DAG behind it
+		"""
+		u, v = e
+		self.removed.add(e)
+		if u not in self.nxt or v not in self.nxt[u]:
+			# Not on any min-hop path, nothing changes
+			return
+		self.hops(u).remove(v)
+		if self.nxt[u]:
+			# Another next hop keeps the distance of u
+			return
+		d = self.d
+		nxt = self.nxt
+
+		# Collect the nodes that lose every next hop
+		aff = [u]; aff_set = set(aff); hdr = 0
+		while hdr < len(aff):
+			x = aff[hdr]
+			hdr += 1
+			for y in self.pred[x]:
+				if y in aff_set or y not in nxt or x not in nxt[y]:
+					continue
+				self.hops(y).remove(x)
+				if not nxt[y]:
+					aff.append(y)
+					aff_set.add(y)
+		for x in aff:
+			del d[x]
+			del nxt[x]
+			self.own.discard(x)
+
+		# Recompute their distances from the unaffected nodes, Dijkstra-like since the start keys differ
+		heap = []
+		for x in aff:
+			cand = [d[w] + 1 for w in self.succ[x] if w in d and not self.blocked(x, w)]
+			if cand:
+				heappush(heap, (min(cand), x))
+		while heap:
+			dx, x = heappop(heap)
+			if x in d:
+				continue
+			d[x] = dx
+			for y in self.pred[x]:
+				if y in aff_set and y not in d and not self.blocked(y, x):
+					heappush(heap, (dx + 1, y))
+
+		# Rebuild the next hops of the repaired nodes, which may also become next hops of unaffected ones
+		for x in aff:
+			if x in d:
+				nxt[x] = [w for w in self.succ[x] if w in d and d[w] + 1 == d[x] and not self.blocked(x, w)]
+				self.own.add(x)
+		for x in aff:
+			if x not in d:
+				continue
+			for y in self.pred[x]:
+				if y not in aff_set and y in d and d[x] + 1 == d[y] and not self.blocked(y, x):
+					self.hops(y).append(x)
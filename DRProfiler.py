@@ -0,0 +1,214 @@
+#####################################################
+#
+# Profiles of whole scheduling runs
+#
+#####################################################
+
+import cProfile
+import pstats
+import glob
+import json
+import os
+import signal
+import timeit
+
+from DRCommon import *
+from DRFlowTable import *
+from DRLogger import *
+
+class DRProfiler(DRCommon):
+	"""
+	Profiles of the scheduler entry points, one per run, collected once attached with DRScheduler.enableProfile().
+		mode: PROFILE to run cProfile and write pstats files,
+			or SAMPLE to sample the stack on the CPU timer and write collapsed stacks,
+			one 'frame;frame;... count' line per stack as read by flamegraph.pl or speedscope
+		out_dir: directory of the files, named <alg>-k<k>-f<flows>-<pid>-<run>.pstats (or .folded),
+			each with a .json of the workload next to it: algorithm, k, flows, requests, event list length, wall time
+		interval: sampling period in seconds of CPU time
+		algs: entry points profiled
+	Sampling relies on SIGPROF and only works in the main thread of a process, which pool workers are.
+	"""
+
+	PROFILE		= 'profile'
+	SAMPLE		= 'sample'
+	MODES		= [PROFILE, SAMPLE]
+	EXT			= {PROFILE:'.pstats', SAMPLE:'.folded'}
+
+	ALGORITHMS	= ['DROfflineNoValuation', 'DROnlineNoValuation', 'ECMPOffline']
+	DEF_INTERVAL	= 0.001
+
+	def __init__(self, mode = None, out_dir = '.', interval = None, algs = None):
+		if mode == None:
+			mode = DRProfiler.PROFILE
+		if mode not in DRProfiler.MODES:
+			raise ValueError('Unknown profiling mode %s' % (mode))
+		self.mode = mode
+		self.out_dir = out_dir
+		self.interval = interval if interval != None else DRProfiler.DEF_INTERVAL
+		self.algs = algs if algs != None else DRProfiler.ALGORITHMS
+		# Workload of each run so far, with its 'file'
+		self.runs = []
+		self.active = False
+
+	def attach(self, sch):
+		"""
+		Wrap the profiled entry points of sch
+		"""
+		for alg in self.algs:
+			setattr(sch, alg, self.profiled(alg, getattr(sch, alg), sch))
+
+	@staticmethod
+	def detach(sch, algs = None):
+		for alg in (algs if algs != None else DRProfiler.ALGORITHMS):
+			sch.__dict__.pop(alg, None)
+
+	def profiled(self, alg, func, sch):
+		def call(req_lst, *args, **kwargs):
+			if self.active:
+				# Entry points calling each other count into the outer run
+				return func(req_lst, *args, **kwargs)
+			self.active = True
+			try:
+				st = timeit.default_timer()
+				if self.mode == DRProfiler.PROFILE:
+					prof = cProfile.Profile()
+					res = prof.runcall(func, req_lst, *args, **kwargs)
+				else:
+					prof = {}
+					res = self.sample(prof, func, req_lst, *args, **kwargs)
+				elapsed = timeit.default_timer() - st
+			finally:
+				self.active = False
+			self.write(alg, sch, req_lst, prof, elapsed)
+			return res
+		return call
+
+	def sample(self, counts, func, *args, **kwargs):
+		"""
+		Run func, counting into counts the stacks (tuples of code objects, outermost first) hit by the timer
+		"""
+		top = self.sample.im_func.func_code
+		def handler(signum, frame):
+			stack = []
+			while frame != None and frame.f_code is not top:
+				stack.append(frame.f_code)
+				frame = frame.f_back
+			if stack:
+				stack = tuple(reversed(stack))
+				counts[stack] = counts.get(stack, 0) + 1
+
+		old = signal.signal(signal.SIGPROF, handler)
+		signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+		try:
+			return func(*args, **kwargs)
+		finally:
+			signal.setitimer(signal.ITIMER_PROF, 0)
+			signal.signal(signal.SIGPROF, old)
+
+	@staticmethod
+	def workload(sch, req_lst):
+		"""
+		Return: (flows, requests) of the input of an entry point
+		"""
+		if isinstance(req_lst, DRFlowTable):
+			return len(req_lst), None
+		return sum(len(req) for req in req_lst), len(req_lst)
+
+	def write(self, alg, sch, req_lst, prof, elapsed):
+		flows, reqs = DRProfiler.workload(sch, req_lst)
+		k = sch.topo.fattree
+		meta = {'alg':alg, 'k':k, 'nodes':len(sch.topo.nodes), 'flows':flows, 'requests':reqs,
+				# The online admission prunes the events behind it, so this is what is left at the end
+				'events':len(sch.event_lst), 'time':elapsed, 'mode':self.mode, 'interval':self.interval,
+				'pid':os.getpid(), 'run':len(self.runs)}
+		if not os.path.isdir(self.out_dir):
+			os.makedirs(self.out_dir)
+		name = '%s-%s-f%d-%d-%d' % (alg, 'k%d' % k if k else 'n%d' % meta['nodes'], flows, meta['pid'], meta['run'])
+		file = os.path.join(self.out_dir, name + DRProfiler.EXT[self.mode])
+		if self.mode == DRProfiler.PROFILE:
+			prof.dump_stats(file)
+		else:
+			with open(file, 'w') as f:
+				for stack, cnt in sorted(prof.items(), key = lambda x:-x[1]):
+					f.write('%s %d\n' % (';'.join(DRProfiler.frameName(code) for code in stack), cnt))
+		meta['file'] = file
+		with open(os.path.join(self.out_dir, name + '.json'), 'w') as f:
+			json.dump(meta, f, indent = 1, sort_keys = True)
+		self.runs.append(meta)
+
+	@staticmethod
+	def frameName(code):
+		return '%s:%s' % (os.path.basename(code.co_filename), code.co_name)
+
+	@staticmethod
+	def files(out_dir):
+		"""
+		Return: the workload dicts of the runs profiled into out_dir
+		"""
+		runs = []
+		for name in sorted(glob.glob(os.path.join(out_dir, '*.json'))):
+			with open(name) as f:
+				runs.append(json.load(f))
+		return runs
+
+	@staticmethod
+	def hotFunctions(runs, top = 20, internal = True):
+		"""
+		Rank the functions over the profiled runs by their own time
+		Input:
+			runs: workload dicts, e.g. DRProfiler.runs or DRProfiler.files()
+			internal: keep only the functions of this package
+		Output:
+			list of (function, calls or None when sampled, own time, total time), the heaviest first
+		"""
+		here = os.path.dirname(os.path.abspath(__file__))
+		here_files = set(os.path.basename(name) for name in glob.glob(os.path.join(here, '*.py')))
+		def keep(filename):
+			return not internal or os.path.basename(filename) in here_files
+
+		rows = []
+		prof = [run['file'] for run in runs if run['mode'] == DRProfiler.PROFILE]
+		if prof:
+			st = pstats.Stats(*prof)
+			for (filename, line, func), (cc, nc, tt, ct, callers) in st.stats.items():
+				if keep(filename):
+					rows.append(('%s:%s' % (os.path.basename(filename), func), nc, tt, ct))
+
+		# Samples: own time at the leaf of a stack, total time once per stack holding the function
+		own = {}; total = {}
+		for run in runs:
+			if run['mode'] != DRProfiler.SAMPLE:
+				continue
+			interval = run['interval']
+			with open(run['file']) as f:
+				for s in f:
+					stack, cnt = s.rsplit(' ', 1)
+					frames = stack.split(';')
+					t = int(cnt) * interval
+					own[frames[-1]] = own.get(frames[-1], 0) + t
+					for frame in set(frames):
+						total[frame] = total.get(frame, 0) + t
+		for frame in total:
+			if keep(frame.split(':')[0]):
+				rows.append((frame, None, own.get(frame, 0), total[frame]))
+
+		rows.sort(key = lambda x:-x[2])
+		return rows[:top]
+
+	@staticmethod
+	def report(runs, top = 20, internal = True):
+		"""
+		Return: the profiled runs and their hot functions as text lines
+		"""
+		lines = []
+		for run in runs:
+			lines.append('%-22s k=%-4s %7d flows %7d events %10.3f s  %s' % (run['alg'], run['k'], run['flows'], run['events'],
+						run['time'], run['file']))
+		lines.append('%-48s %10s %10s %10s' % ('function', 'calls', 'own_s', 'total_s'))
+		for func, calls, own, total in DRProfiler.hotFunctions(runs, top, internal):
+			lines.append('%-48s %10s %10.4f %10.4f' % (func, calls if calls != None else '-', own, total))
+		return lines
+
+	def log(self, logger, top = 20, level = DRLogger.INFO):
+		for line in DRProfiler.report(self.runs, top):
+			logger.log('[INFO] Profile: %s' % (line), level)
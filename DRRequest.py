@@ -40,7 +40,8 @@ class DRRequest(DRCommon):
 			[(s, t, f, a, d)]
 		"""
 		host_num = len(host_lst)
-		sender_lst = [host for host in host_lst]
+		# Position of the receiver excluded from the senders, None if all hosts can send
+		excl = None
 
 		if flow_num == None:
 			if min_flow_num == None:
@@ -55,26 +56,96 @@ class DRRequest(DRCommon):
 		if max_flow_size == None:
 			max_flow_size = DRRequest.MAX_FLOW_SIZE
 		if receiver == None:
-			receiver = host_lst[numpy.random.randint(0, host_num)]
-			if receiver in sender_lst:
-				sender_lst.remove(receiver)
+			excl = numpy.random.randint(0, host_num)
+			receiver = host_lst[excl]
 
 		# All flows arrive at the same time
 		arriving_time 	= 0
-		# Exponential distribution of deadlines
-		deadline 		= numpy.random.exponential(avr_dl, size=flow_num)
-		for i in xrange(len(deadline)):
-			if deadline[i] < DRRequest.MIN_DEADLINE:
-				deadline[i] = DRRequest.MIN_DEADLINE
+		# Exponential distribution of deadlines, bounded below by MIN_DEADLINE
+		deadline 		= numpy.maximum(numpy.random.exponential(avr_dl, size=flow_num), DRRequest.MIN_DEADLINE)
 		# Uniform distribution of flow sizes
 		flow_size 		= numpy.random.uniform(min_flow_size, max_flow_size, size=flow_num)
-		# Uniform distribution of sender choices
-		sender 			= numpy.random.randint(0, len(sender_lst), size=flow_num)
+		# Uniform distribution of sender choices, skipping over the receiver
+		sender 			= numpy.random.randint(0, host_num if excl == None else host_num - 1, size=flow_num)
+		if excl != None:
+			sender[sender >= excl] += 1
 
 		request = []
 		for i in xrange(flow_num):
 			# Converting the KBytes flow sizes to Mbits flow sizes
 			#	Now ms * Gbps = Mbits
-			request.append((sender_lst[sender[i]], receiver, float(flow_size[i]) / 125, arriving_time, deadline[i]))
+			request.append((host_lst[sender[i]], receiver, float(flow_size[i]) / 125, arriving_time, deadline[i]))
 
 		return request
+
+	# Flow record of the batch generators: host indices, Mbits and ms
+	FLOW_DTYPE = numpy.dtype([('req', numpy.int32), ('src', numpy.int32), ('dst', numpy.int32),
+							('size', numpy.float64), ('arrival', numpy.float64), ('deadline', numpy.float64)])
+
+	@staticmethod
+	def QueryAggrBatch(host_num, req_num, flow_num = None, min_flow_num = None, max_flow_num = None, avr_dl = None, min_flow_size = None, max_flow_size = None, arrv_rate = None):
+		"""
+		Generate req_num query aggregate workloads at once:
+			Requests arrive as a Poisson process, all flows of a request arriving together towards one receiver
+		Input:
+			host_num:	number of hosts, the flows refer to hosts by their index in [0, host_num)
+			arrv_rate:	average number of requests per second, default to AVR_ARRV_RATE
+			others:		as for QueryAggr
+		Output:
+			structured array of FLOW_DTYPE records, grouped by request in arriving order
+		"""
+		if min_flow_num == None:
+			min_flow_num = DRRequest.MIN_FLOW_NUMBER
+		if max_flow_num == None:
+			max_flow_num = DRRequest.MAX_FLOW_NUMBER
+		if avr_dl == None:
+			avr_dl = DRRequest.AVR_DEADLINE
+		if min_flow_size == None:
+			min_flow_size = DRRequest.MIN_FLOW_SIZE
+		if max_flow_size == None:
+			max_flow_size = DRRequest.MAX_FLOW_SIZE
+		if arrv_rate == None:
+			arrv_rate = DRRequest.AVR_ARRV_RATE
+
+		# Per request: number of flows, arriving time in ms, receiver
+		if flow_num == None:
+			flow_cnt = numpy.random.randint(min_flow_num, max_flow_num, size=req_num)
+		else:
+			flow_cnt = numpy.full(req_num, flow_num, dtype=numpy.int64)
+		arriving_time = numpy.cumsum(numpy.random.exponential(1000.0 / arrv_rate, size=req_num))
+		receiver = numpy.random.randint(0, host_num, size=req_num)
+
+		# Per flow
+		total = int(flow_cnt.sum())
+		flows = numpy.empty(total, dtype=DRRequest.FLOW_DTYPE)
+		req = numpy.repeat(numpy.arange(req_num, dtype=numpy.int32), flow_cnt)
+		flows['req'] = req
+		flows['dst'] = receiver[req]
+		# Senders are drawn among the other hosts
+		sender = numpy.random.randint(0, host_num - 1, size=total)
+		sender += sender >= flows['dst']
+		flows['src'] = sender
+		# Converting the KBytes flow sizes to Mbits flow sizes
+		flows['size'] = numpy.random.uniform(min_flow_size, max_flow_size, size=total) / 125
+		flows['arrival'] = arriving_time[req]
+		flows['deadline'] = numpy.maximum(numpy.random.exponential(avr_dl, size=total), DRRequest.MIN_DEADLINE)
+
+		return flows
+
+	@staticmethod
+	def toReqLst(flows, host_lst):
+		"""
+		Convert FLOW_DTYPE records into the request list taken by the scheduler
+		Output:
+			[[(s, t, f, a, d), ...], ...], one list per request
+		"""
+		req_lst = []
+		if len(flows) == 0:
+			return req_lst
+		# Boundaries between requests
+		bnd = numpy.flatnonzero(flows['req'][1:] != flows['req'][:-1]) + 1
+		src = flows['src'].tolist(); dst = flows['dst'].tolist()
+		size = flows['size'].tolist(); arr = flows['arrival'].tolist(); dl = flows['deadline'].tolist()
+		for st, ed in zip([0] + bnd.tolist(), bnd.tolist() + [len(flows)]):
+			req_lst.append([(host_lst[src[i]], host_lst[dst[i]], size[i], arr[i], dl[i]) for i in xrange(st, ed)])
+		return req_lst
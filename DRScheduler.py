@@ -4,6 +4,8 @@
 #
 #####################################################
 
+import copy
+import timeit
 import numpy
 import scipy
 import networkx as nx
@@ -12,14 +14,111 @@ from bisect import *
 from DRCommon import *
 from DRTopo import *
 from DRLogger import *
+from DRTimeline import *
+from DREventList import *
+from DRCompactTopo import *
+from DRPaths import *
+from DRFlowTable import *
+from DRLPBound import *
+from DRStats import *
+from DRProfiler import *
+
+class DRSnapshot(DRCommon):
+	"""
+	Frozen scheduler state: event list, capacity timelines and current time.
+	The timelines are shared with every scheduler restored from the snapshot, which copies one before writing it.
+	"""
+
+	def __init__(self, sch):
+		self.version = sch.topo.version
+		self.event_lst = sch.event_lst.copy()
+		self.rate_lst = dict(sch.rate_lst)
+		self.now = sch.now
+		self.live_edges = set(sch.live_edges)
+
+
+class DRJournal(DRCommon):
+	"""
+	Undo log of the insertions made since DRScheduler.begin().
+		rate_lst: edge -> (timeline, owned, live) as before its first write
+		events: timestamps added to the event list
+		decisions: (flow, res, retries) decision records held until the transaction ends
+	"""
+
+	def __init__(self):
+		self.rate_lst = {}
+		self.events = []
+		self.decisions = []
+
+
+class DRProbe(DRCommon):
+	"""
+	Outcome of DRScheduler.probe(), to be committed as is with DRScheduler.commit().
+		res_lst: for each flow, (flow, path, rate_alloc, finish_time) if it fits in, None otherwise
+		feasible: whether every flow fits in
+		finish_time: latest finish time of the flows fitting in, None if none does
+		gen: (token, state generation) of the scheduler when probed
+	"""
+
+	def __init__(self, gen, res_lst):
+		self.gen = gen
+		self.res_lst = res_lst
+		self.feasible = all(res != None for res in res_lst)
+		finish_lst = [res[3] for res in res_lst if res != None]
+		self.finish_time = max(finish_lst) if finish_lst else None
+
 
 class DRScheduler(DRCommon):
 	"""
 	Scheduler class. First initialize with topo, then feed with requests list, last schedules.
+		valid_mode: how DRPathValidation computes the path bottleneck
+			VALID_LOOP:		walk the global event list edge by edge
+			VALID_NUMPY:	merge the path's own capacity timelines with NumPy (default)
+		compact: run the path searches on the compiled integer topology with reusable search state
+		cache_size: number of (s, t) pairs and destinations kept by the ECMP path cache, 0 to disable
+		reroute: how DRFlowRouting searches again after marking an edge
+			REROUTE_RESTART:	a new DRBFS from the source (default)
+			REROUTE_INCR:		repair the previous search with DRReRouter, fewer full passes for the same paths
+			REROUTE_SHARED:		walk the shortest-path DAG of the destination, shared by all the flows towards it
+								through the path cache, repairing a private copy with DRSharedRouter
+	On a known fattree (DRTopo.fattree) the shortest paths come from DRFatTreePaths instead of a search.
 	"""
 
-	def __init__(self, topo, logger = None):
+	# Path validation modes
+	VALID_LOOP	= 0
+	VALID_NUMPY	= 1
+	# Re-routing modes
+	REROUTE_RESTART	= 0
+	REROUTE_INCR	= 1
+	REROUTE_SHARED	= 2
+
+	def __init__(self, topo, logger = None, valid_mode = None, compact = False, cache_size = None, reroute = None):
 		self.logger = DRLogger(logger)
+		if valid_mode == None:
+			valid_mode = DRScheduler.VALID_NUMPY
+		self.valid_mode = valid_mode
+		if reroute == None:
+			reroute = DRScheduler.REROUTE_RESTART
+		self.reroute = reroute
+		self.compact = compact
+		self.csr = None
+		self.paths = None
+		# State every init() starts from, see setBaseline()
+		self.baseline = None
+		# Generation of the reservations, bumped whenever a flow is inserted, a state restored or the time advanced
+		self.gen = 0
+		# Identity of this scheduler's state, renewed by fork() and DRScratch() whose generations go their own way
+		self.token = object()
+		# Undo log of the open transaction, see begin()
+		self.journal = None
+		# Most paths DRMultiPathPlaceFlow splits a flow over, None for all
+		self.max_paths = None
+		# Wall time of each flow decision of DRTableRouting is appended here unless None
+		self.flow_lat = None
+		# Per-phase instrumentation, see enableStats()
+		self.stats = None
+		# Profiles of the entry points, see enableProfile()
+		self.profiler = None
 
 		if type(topo) == DRTopo:
 			self.topo = topo
@@ -29,7 +128,12 @@ class DRScheduler(DRCommon):
 			self.logger.log('[DEBUG] Scheduler: topology input incorrect. Please check.')
 			return
 
-		self.logger.log('[INFO] Scheduler: topology loaded with %d nodes and %d edges.' % (len(self.topo.nodes), len(self.topo.edges)))
+		self.logger.info('[INFO] Scheduler: topology loaded with %d nodes and %d edges.', len(self.topo.nodes), len(self.topo.edges))
+
+		# Shortest path sets, kept across init() until the topology changes
+		if cache_size == None:
+			cache_size = DRPathCache.DEF_SIZE
+		self.path_cache = DRPathCache(self.topo, cache_size) if cache_size > 0 else None
 
 		self.init()
 
@@ -37,12 +141,177 @@ class DRScheduler(DRCommon):
 		"""
 		Initialize parameters for calculation
 		"""
-		# Event list: time
-		self.event_lst = [0, float('inf')]
-		# Rate list of each edge edge->(time->rate)
-		# 	Rate here is the residual capacity
-		#	Ensure that there is one initial timestamp with full capacity and one infinite timestamp with no capacity
-		self.rate_lst = {e:{0:self.topo.topo[e[0]][e[1]]['Capacity'], float('inf'):0} for e in self.topo.edges}
+		if self.baseline == None or self.baseline.version != self.topo.version:
+			if self.baseline != None:
+				self.logger.log('[DEBUG] Scheduler: topology changed, baseline dropped.', DRLogger.DEBUG)
+			# Event list: time
+			self.event_lst = DREventList([0, float('inf')])
+			# Rate list of each edge edge->DRTimeline
+			# 	Rate here is the residual capacity
+			#	Each timeline starts with one initial timestamp with full capacity and one infinite timestamp with no capacity
+			self.rate_lst = {e:DRTimeline(self.topo.cap[e]) for e in self.topo.edges}
+			# Current time of the online admission, and the edges holding breakpoints to prune as it advances
+			self.now = 0
+			self.live_edges = set()
+			# The empty state is built once, later runs fork it
+			self.baseline = self.snapshot()
+		self.restore(self.baseline)
+		# Number of full BFS passes in total, and for each flow in the order DRFlowRouting handled them
+		self.bfs_cnt = 0
+		self.flow_bfs_lst = []
+		if self.compact:
+			self.DRInitCompact()
+		# Closed-form shortest paths when the topology is a known fattree
+		if self.topo.fattree:
+			self.paths = DRFatTreePaths(self.topo.fattree)
+		else:
+			self.paths = None
+
+	######################################
+	# Snapshots
+
+	def snapshot(self):
+		"""
+		Capture the current state, sharing the capacity timelines until either side writes them
+		"""
+		snap = DRSnapshot(self)
+		# From now on the timelines are shared, copy them before the next write
+		self.owned = set()
+		return snap
+
+	def restore(self, snap):
+		"""
+		Continue from snap, a DRSnapshot of this scheduler or of one on the same topology
+		"""
+		self.event_lst = snap.event_lst.copy()
+		self.rate_lst = dict(snap.rate_lst)
+		self.now = snap.now
+		self.live_edges = set(snap.live_edges)
+		# Edges whose timeline is private to this scheduler
+		self.owned = set()
+		self.journal = None
+		self.gen += 1
+
+	def setBaseline(self, snap = None):
+		"""
+		Make every init(), thus every algorithm run, start from snap instead of the empty network
+			snap: default to a snapshot of the current state, e.g. with background reservations already admitted
+		"""
+		if snap == None:
+			snap = self.snapshot()
+		self.baseline = snap
+
+	def clearBaseline(self):
+		self.baseline = None
+
+	def fork(self, snap = None):
+		"""
+		Return: a scheduler sharing the topology and caches, starting from snap (default: the current state)
+			Forks share the search state as well, so they must be run one at a time
+		"""
+		if snap == None:
+			snap = self.snapshot()
+		sch = copy.copy(self)
+		sch.token = object()
+		sch.restore(snap)
+		sch.bfs_cnt = 0
+		sch.flow_bfs_lst = []
+		if self.stats != None:
+			sch.enableStats(self.stats)
+		if self.profiler != None:
+			sch.enableProfile(self.profiler)
+		return sch
+
+	def DRScratch(self):
+		"""
+		Return: a throwaway fork of the current state, to be dropped before this scheduler changes again
+			Unlike fork(), this scheduler keeps writing its own timelines in place
+		"""
+		sch = copy.copy(self)
+		sch.token = object()
+		sch.event_lst = self.event_lst.copy()
+		sch.rate_lst = dict(self.rate_lst)
+		sch.live_edges = set(self.live_edges)
+		sch.owned = set()
+		sch.flow_bfs_lst = []
+		if self.stats != None:
+			sch.enableStats(self.stats)
+		if self.profiler != None:
+			sch.enableProfile(self.profiler)
+		return sch
+
+	def DRWritable(self, e):
+		"""
+		Return: the capacity timeline of e, copied first if it is shared with a snapshot
+		"""
+		if e not in self.owned:
+			self.rate_lst[e] = self.rate_lst[e].copy()
+			self.owned.add(e)
+		return self.rate_lst[e]
+
+	def DRInitCompact(self):
+		"""
+		Compile the topology and allocate the search state reused by every flow
+		"""
+		csr = self.topo.compile()
+		if csr is self.csr:
+			return
+		self.csr = csr
+		# A node is visited in the current search when its stamp equals the search generation
+		self.bfs_gen = 0
+		self.bfs_seen = [0] * csr.node_num
+		self.bfs_d = [0] * csr.node_num
+		self.bfs_pa = [-1] * csr.node_num
+		self.bfs_pa_lst = [[] for v in xrange(csr.node_num)]
+		self.edge_mark = DREdgeMark(csr)
+
+	def DRNewEdgeMark(self):
+		"""
+		Return: an edge mark with no edge marked
+		"""
+		if self.csr is not None:
+			self.edge_mark.clear()
+			return self.edge_mark
+		return {e:False for e in self.topo.edges}
+
+
+	######################################
+	# Instrumentation
+
+	def enableStats(self, stats = None):
+		"""
+		Time and count the scheduling phases until disableStats()
+			stats: DRStats to collect into, default to a new one
+		Return: the DRStats
+		"""
+		self.disableStats()
+		if stats == None:
+			stats = DRStats()
+		stats.attach(self)
+		self.stats = stats
+		return stats
+
+	def disableStats(self):
+		DRStats.detach(self)
+		self.stats = None
+
+	def enableProfile(self, profiler = None):
+		"""
+		Profile every run of the entry points until disableProfile()
+			profiler: DRProfiler to write the runs with, default to a new one writing cProfile runs into the current directory
+		Return: the DRProfiler
+		"""
+		self.disableProfile()
+		if profiler == None:
+			profiler = DRProfiler()
+		profiler.attach(self)
+		self.profiler = profiler
+		return profiler
+
+	def disableProfile(self):
+		if self.profiler != None:
+			DRProfiler.detach(self, self.profiler.algs)
+		self.profiler = None
 
 
 	######################################
@@ -58,6 +327,13 @@ class DRScheduler(DRCommon):
 		Output:
 			p: [s, v1, v2, ..., t]
 		"""
+		p = self.DRFatTreePath(flow, edge_mark)
+		if p != None:
+			return p
+		self.bfs_cnt += 1
+		if self.csr is not None:
+			return self.DRBFSCompact(flow, edge_mark)
+
 		# Distance flag for each node
 		d = {v:float('inf') for v in self.topo.nodes}
 		# Parent node for each node
@@ -94,6 +370,61 @@ class DRScheduler(DRCommon):
 
 		return p
 
+	def DRFatTreePath(self, flow, edge_mark):
+		"""
+		Any unmarked shortest path on a known fattree, None if a search is needed
+			Searching is then only for detours once all shortest paths are marked
+		"""
+		if self.paths == None:
+			return None
+		p_gen = self.paths.paths(flow[0], flow[1], edge_mark)
+		if p_gen == None:
+			return None
+		return next(p_gen, None)
+
+	def DRBFSCompact(self, flow, edge_mark):
+		"""
+		DRBFS on the compact topology, edge_mark being a DREdgeMark
+		"""
+		csr = self.csr
+		self.bfs_gen += 1
+		gen = self.bfs_gen
+		seen = self.bfs_seen
+		d = self.bfs_d
+		pa = self.bfs_pa
+		stamp = edge_mark.stamp
+		mark_gen = edge_mark.gen
+		s = csr.ids[flow[0]]
+		t = csr.ids[flow[1]]
+
+		# BFS to find a min-hop path, a node being visited once its stamp is the current generation
+		queue = [s]; hdr = 0; d[s] = 0; seen[s] = gen
+		while hdr < len(queue):
+			u = queue[hdr]
+			hdr += 1
+
+			for v, eid in zip(csr.nbr[u], csr.nbr_edge[u]):
+				if stamp[eid] == mark_gen or seen[v] == gen:
+					continue
+				queue.append(v)
+				seen[v] = gen
+				d[v] = d[u] + 1
+				pa[v] = u
+				if v == t:
+					hdr = len(queue)
+					break
+
+		if seen[t] != gen:
+			return False
+
+		p = [csr.names[t]]; v = t
+		while v != s:
+			v = pa[v]
+			p.append(csr.names[v])
+		p.reverse()
+
+		return p
+
 	def DRFindMinimalEdge(self, flow, edge_lst):
 		"""
 		Find the edge in the edge_lst with the minimal cumulative size regarding the flow
@@ -104,26 +435,8 @@ class DRScheduler(DRCommon):
 		min_cum_size = float('inf')
 		min_edge = (-1, -1)
 		for e in edge_lst:
-			prev_time = arr_time
-			prev_rate = 0
-			cum_size = 0
-			for time, rate in sorted(self.rate_lst[e].items()):
-				if time > arr_time:
-					if time < end_time:
-						cum_size += prev_rate * (time - prev_time)
-					else:
-						cum_size += prev_rate * (end_time - prev_time)
-						break
-				if cum_size >= min_cum_size:
-					# Break if already >= minimum
-					break
-				elif time >= end_time:
-					# Break if time exceeds deadline
-					break
-
-				prev_time = time
-				prev_rate = rate
-
+			# Sizes reaching the current minimum are not needed in full
+			cum_size = self.rate_lst[e].area(arr_time, end_time, min_cum_size)
 			if cum_size < min_cum_size:
 				min_cum_size = cum_size
 				min_edge = e
@@ -136,19 +449,37 @@ class DRScheduler(DRCommon):
 			If yes, return True and the actual rate allocation based on the strategy that finish it asap;
 			If not, return False, the minimum edge and the cumulative size.
 		"""
+		edge_lst = [(p[i], p[i+1]) for i in xrange(len(p)-1)]
+		if self.valid_mode == DRScheduler.VALID_NUMPY and edge_lst:
+			return self.DRPathValidationNumpy(flow, edge_lst)
+
 		path_rate_lst = []
 
 		arr_time = flow[3]
 		end_time = flow[3] + flow[4]
-		edge_lst = [(p[i], p[i+1]) for i in xrange(len(p)-1)]
-		# Calculate the bottlenecked rate at each event point
-		for evt in self.event_lst:
+		# Start from the bottlenecked rate in effect at the arriving time
+		if edge_lst:
+			path_rate_lst.append((arr_time, min(self.rate_lst[e].rate(arr_time) for e in edge_lst)))
+		# Calculate the bottlenecked rate at each later event point, up to the first one past the deadline
+		#	Each edge keeps a cursor on its breakpoints, moved forward along with the events
+		tl_lst = [self.rate_lst[e] for e in edge_lst]
+		cur_lst = [bisect_right(tl.times, arr_time) for tl in tl_lst]
+		for evt in self.event_lst.irange(arr_time):
 			min_rate = float('inf')
-			for e in edge_lst:
-				if evt in self.rate_lst[e].keys() and self.rate_lst[e][evt] < min_rate:
-					min_rate = self.rate_lst[e][evt]
+			for i in xrange(len(tl_lst)):
+				times = tl_lst[i].times
+				pos = cur_lst[i]
+				# The infinite breakpoint ends every timeline
+				while times[pos] < evt:
+					pos += 1
+				cur_lst[i] = pos
+				if times[pos] == evt and tl_lst[i].rates[pos] < min_rate:
+					min_rate = tl_lst[i].rates[pos]
 			if min_rate < float('inf'):
 				path_rate_lst.append((evt, min_rate))
+				if evt >= end_time:
+					# The walk below stops there
+					break
 
 		# Calculate the cumulative size over the bottleneck rates between arr_time and end_time
 		prev_time = arr_time
@@ -187,18 +518,74 @@ class DRScheduler(DRCommon):
 		edge, size = self.DRFindMinimalEdge(flow, edge_lst)
 		return False, edge, size
 
+	def DRPathBottleneck(self, edge_lst):
+		"""
+		Merge the capacity timelines of the edges into the bottleneck rate profile of the path.
+			As in the event list walk, the rate at a timestamp is the minimum over the edges having a breakpoint there.
+		Output:
+			times, rates: NumPy arrays sorted by time
+		"""
+		arrays = [self.rate_lst[e].arrays() for e in edge_lst]
+		times = numpy.concatenate([arr[0] for arr in arrays])
+		rates = numpy.concatenate([arr[1] for arr in arrays])
+		order = numpy.argsort(times, kind='mergesort')
+		times = times[order]
+		rates = rates[order]
+		# Group the equal timestamps and take the minimum rate of each group
+		grp = numpy.flatnonzero(numpy.concatenate(([True], times[1:] != times[:-1])))
+		return times[grp], numpy.minimum.reduceat(rates, grp)
+
+	def DRPathValidationNumpy(self, flow, edge_lst):
+		"""
+		Vectorized DRPathValidation over the path's own breakpoints, with the same results.
+		"""
+		arr_time = flow[3]
+		end_time = flow[3] + flow[4]
+		times, rates = self.DRPathBottleneck(edge_lst)
+		# Start from the bottlenecked rate in effect at the arriving time, then the later breakpoints
+		start = numpy.searchsorted(times, arr_time, 'right')
+		start_rate = min(self.rate_lst[e].rate(arr_time) for e in edge_lst)
+		times = numpy.concatenate(([arr_time], times[start:]))
+		rates = numpy.concatenate(([start_rate], rates[start:]))
+
+		# Segment j spans times[j] -> min{times[j+1], end_time} with rate rates[j]
+		seg_size = rates[:-1] * (numpy.minimum(times[1:], end_time) - times[:-1])
+		cum_size = numpy.cumsum(seg_size)
+		# The walk stops at the first segment reaching the deadline
+		last = min(numpy.searchsorted(times[1:], end_time, 'left'), len(cum_size) - 1)
+		# Rates can be negative, so search the running maximum for the first segment carrying the flow size
+		seg = numpy.searchsorted(numpy.maximum.accumulate(cum_size[:last+1]), flow[2], 'left')
+
+		if seg <= last:
+			prev_time = float(times[seg])
+			prev_rate = float(rates[seg])
+			new_end_time = float(flow[2] - (cum_size[seg] - seg_size[seg])) / prev_rate + prev_time
+			rate_alloc = [(-1, 0)] + zip(times[:seg+1].tolist(), rates[:seg+1].tolist())
+			# Add the finish rate onto the allocation list
+			rate_alloc.append((new_end_time, 0))
+
+			return True, edge_lst, self.DRAllocTrim(rate_alloc), new_end_time
+
+		# If not, return the minimum edge regarding the cumulative size
+		edge, size = self.DRFindMinimalEdge(flow, edge_lst)
+		return False, edge, size
+
 	def DRAllocTrim(self, rate_alloc):
 		'''
 		Trim the allocation vector so that the 0 items in the front is removed
+			Only the allocation from the last positive rate on is kept; the list is trimmed in place
 		'''
 		kFlg = -1
-		for time, rate in rate_alloc:
-			if rate > 0:
-				kFlg = rate_alloc.index((time, rate))
+		for i in xrange(len(rate_alloc) - 1, -1, -1):
+			if rate_alloc[i][1] > 0:
+				# Position of the first entry equal to the last positive one
+				kFlg = rate_alloc.index(rate_alloc[i])
+				break
 
 		if kFlg > 0:
-			rate_alloc = rate_alloc[kFlg:]
-		rate_alloc.insert(0, (-1, 0))
+			rate_alloc[:kFlg] = [(-1, 0)]
+		else:
+			rate_alloc.insert(0, (-1, 0))
 
 		return rate_alloc
 
@@ -207,65 +594,133 @@ class DRScheduler(DRCommon):
 		Insert the flow path and the rate_allocation into the topology.
 		Update corresponding rate vectors.
 		"""
+		self.gen += 1
+		jr = self.journal
 		st_time = flow[3]
 		for time, rate in rate_alloc:
+			if time < self.now:
+				# Already pruned past
+				continue
 			# Add timestamps onto the event list
-			st_pos = bisect_left(self.event_lst, time)
-			if self.event_lst[st_pos] == time:
+			if not self.event_lst.add(time):
 				continue
-			self.event_lst.insert(st_pos, time)
+			if jr != None:
+				jr.events.append(time)
 
 		for e in edge_lst:
-			# Add timestamps onto edge specific capacity vectors
-			# The first allocation is always (-1, 0)
-			# Allocation timestamps
-			alloc_hdr = 0
-			prev_time = rate_alloc[alloc_hdr][0]
-			prev_rate = rate_alloc[alloc_hdr][1]
-			# Capacity timestamps
-			rate_lst = sorted(self.rate_lst[e].items())
-			lst_hdr = 0
-			time = rate_lst[lst_hdr][0]
-			rate = rate_lst[lst_hdr][1]
-			cur_cap = rate
-			# List to be inserted after the loop
-			# insert_lst = []
-			# inserted_size = 0
-
-			#print '-------------------'
-			#print rate_alloc
-			#print rate_lst
-			while lst_hdr < len(rate_lst) and alloc_hdr < len(rate_alloc) - 1:
-				prev_time = rate_alloc[alloc_hdr][0]
-				prev_rate = rate_alloc[alloc_hdr][1]
-				time = rate_lst[lst_hdr][0]
-				rate = rate_lst[lst_hdr][1]
-				#print '--> %f, %f --> %f, %f' % (rate_alloc[alloc_hdr+1][0], rate_alloc[alloc_hdr+1][1], time, rate)
-				if time < rate_alloc[alloc_hdr+1][0]:
-					# If the capacity timestamp is smaller than the next allocation timestamp, proceed capacity list
-					self.rate_lst[e][time] -= prev_rate
-					# Store the previous rate for the insert to take place
-					cur_cap = rate
-					lst_hdr += 1
-				elif time == rate_alloc[alloc_hdr+1][0]:
-					# If the capacity timestamp equals the next allocation timestamp
-					#	First proceed alloc list
-					alloc_hdr += 1
-					#	Modify the capacity
-					self.rate_lst[e][time] -= rate_alloc[alloc_hdr][1]
-					# Store the previous rate for the insert to take place
-					cur_cap = rate
-					#	Proceed the capacity list
-					lst_hdr += 1
-				else:
-					# If the capacity timestamp is larger than even the next allocation timestamp
-					#	Insert the allocation and proceed the allocation list
-					self.rate_lst[e][rate_alloc[alloc_hdr+1][0]] = cur_cap - rate_alloc[alloc_hdr+1][1]
-					# insert_lst.append(rate_alloc[alloc_hdr+1])
-					alloc_hdr += 1
-				#print rate_alloc
-				#print e, time, self.rate_lst[e]
-				#print
+			if jr != None and e not in jr.rate_lst:
+				# Keep the timeline as it is, the write below goes to a copy
+				jr.rate_lst[e] = (self.rate_lst[e], e in self.owned, e in self.live_edges)
+				self.owned.discard(e)
+			# Deduce the allocation from edge specific capacity timelines
+			self.DRWritable(e).subtract(rate_alloc)
+			self.live_edges.add(e)
+
+	def DRFindPath(self, flow, edge_mark, router, removed):
+		"""
+		Next min-hop path of a flow avoiding the marked edges
+		Input:
+			router: DRReRouter (DRReRouterCompact on a compact topology) of the previous attempts of the flow, None if there is none yet
+			removed: edge marked since the previous attempt, None at the first one
+		Output:
+			p (False if none), router
+		"""
+		if self.reroute == DRScheduler.REROUTE_RESTART:
+			return self.DRBFS(flow, edge_mark), router
+		if router != None:
+			if removed != None:
+				router.remove(removed)
+			return router.path(), router
+		p = self.DRFatTreePath(flow, edge_mark)
+		if p == None:
+			if self.reroute == DRScheduler.REROUTE_SHARED:
+				router = DRSharedRouter(self.topo.topo, flow[0], flow[1], self.DRDestDAG(flow[1]), edge_mark)
+			elif self.csr is not None:
+				router = DRReRouterCompact(self.csr, flow[0], flow[1], edge_mark)
+				self.bfs_cnt += 1
+			else:
+				router = DRReRouter(self.topo.topo, flow[0], flow[1], edge_mark)
+				self.bfs_cnt += 1
+			p = router.path()
+		return p, router
+
+	def DRDestDAG(self, t):
+		"""
+		Shortest-path DAG towards t, from the path cache unless there is none
+		Output:
+			(d, nxt), see DRPathCache.dag
+		"""
+		cache = self.path_cache
+		if cache == None:
+			self.bfs_cnt += 1
+			return DRPathCache(self.topo, 1).dag(t)
+		builds = cache.builds
+		dag = cache.dag(t)
+		self.bfs_cnt += cache.builds - builds
+		return dag
+
+	def DRRouteFlow(self, flow):
+		"""
+		Recursively find paths for one flow until either one can fit in or no path
+		Output:
+			(path, path_edge_list, rate_alloc, finish_time), or None if no path can fit in
+		"""
+		edge_mark = self.DRNewEdgeMark()
+		router = None
+		removed = None
+		self.route_tries = 0
+		bfs_cnt = self.bfs_cnt
+		path, path_edge_list, rate_alloc, finish_time = None, None, None, None
+		# 1. Recursively find a path and validate if the path is valid
+		while True:
+			# 1.1 Find a path, here BFS is using, or the re-routing engine keeping the BFS between attempts
+			p, router = self.DRFindPath(flow, edge_mark, router, removed)
+			self.route_tries += 1
+			if not p:
+				break
+			# 1.2 Validate the path with cumulative size between arr_time and end_time
+			res = self.DRPathValidation(flow, p)
+			if res[0]:
+				# If true, res[1] is the path edge list, res[2] is the rate allocation, res[3] is the finish time of the flow
+				path = p
+				path_edge_list = res[1]
+				rate_alloc = res[2]
+				finish_time = res[3]
+				break
+			# If false, res[1] is the minimum edge, res[2] is the corresponding cum size
+			edge_mark[res[1]] = True
+			removed = res[1]
+		self.flow_bfs_lst.append(self.bfs_cnt - bfs_cnt)
+
+		if not path_edge_list:
+			# Cannot find a path to fit in
+			return None
+		return path, path_edge_list, rate_alloc, finish_time
+
+	def DRPlaceFlow(self, flow):
+		"""
+		Route one flow and, if a path can fit in, deduce its rate
+		Output:
+			(flow, path, rate_alloc, finish_time) if placed, None otherwise
+		"""
+		res = self.DRRouteFlow(flow)
+		if res != None:
+			path, path_edge_list, rate_alloc, finish_time = res
+			self.DRInsertFlow(flow, path_edge_list, rate_alloc)
+			res = (flow, path, rate_alloc, finish_time)
+		if self.logger.rec_out != None:
+			self.DRDecision(flow, res, self.route_tries - 1)
+		return res
+
+	def DRDecision(self, flow, res, retries = 0):
+		"""
+		Record the decision on one flow, see DRLogger.decision()
+			Within a transaction the record waits for its end, a rollback turning it into a rejection
+		"""
+		if self.journal != None:
+			self.journal.decisions.append((flow, res, retries))
+		else:
+			self.logger.decision(flow, res, retries)
 
 	def DRFlowRouting(self, flow_lst):
 		"""
@@ -278,48 +733,242 @@ class DRScheduler(DRCommon):
 		succ_lst = []
 		fail_lst = []
 		for flow in flow_lst:
-			edge_mark = {e:False for e in self.topo.edges}
-			path, path_edge_list, rate_alloc, finish_time = None, None, None, None
-			# 1. Recursively find a path and validate if the path is valid
-			while True:
-				# 1.1 Find a path, here BFS is using
-				p = self.DRBFS(flow, edge_mark)
-				if not p:
-					break
-				# 1.2 Validate the path with cumulative size between arr_time and end_time
-				res = self.DRPathValidation(flow, p)
-				if res[0]:
-					# If true, res[1] is the path edge list, res[2] is the rate allocation, res[3] is the finish time of the flow
-					path = p
-					path_edge_list = res[1]
-					rate_alloc = res[2]
-					finish_time = res[3]
-					break
-				# If false, res[1] is the minimum edge, res[2] is the corresponding cum size
-				edge_mark[res[1]] = True
-			# 2. If find a valid path, insert the path into the
-			if not path_edge_list:
+			res = self.DRPlaceFlow(flow)
+			if res == None:
 				# Cannot find a path to fit in
 				fail_lst.append(flow)
-				continue
-			# Can find a path, mark and deduce the rate
-			self.DRInsertFlow(flow, path_edge_list, rate_alloc)
-			succ_lst.append((flow, path, rate_alloc, finish_time))
+			else:
+				succ_lst.append(res)
 
 		return succ_lst, fail_lst
 
+	def DRTableRouting(self, table, order, place):
+		"""
+		Place the flows of a DRFlowTable one by one
+		Input:
+			order: index array of the flows in the order to place them
+			place: flow -> (flow, path, rate_alloc, finish_time) or None, such as DRPlaceFlow
+		Output:
+			DRFlowResult
+		"""
+		res = DRFlowResult(table)
+		lat = self.flow_lat
+		timer = timeit.default_timer
+		for i in order.tolist():
+			if lat != None:
+				st = timer()
+				out = place(table.flow(i))
+				lat.append(timer() - st)
+			else:
+				out = place(table.flow(i))
+			if out != None:
+				res.record(i, out[1], out[3])
+		return res
+
+	######################################
+	# Transactions
+
+	def begin(self):
+		"""
+		Open a transaction: the flows inserted from now on can be undone with rollback()
+			Only the timelines written meanwhile are copied, the current time must not advance before it ends
+		"""
+		self.journal = DRJournal()
+
+	def rollback(self):
+		"""
+		Undo every insertion since begin() and close the transaction
+		"""
+		jr = self.journal
+		self.journal = None
+		for time in jr.events:
+			self.event_lst.remove(time)
+		for e, (tl, owned, live) in jr.rate_lst.iteritems():
+			self.rate_lst[e] = tl
+			if owned:
+				self.owned.add(e)
+			else:
+				self.owned.discard(e)
+			if not live:
+				self.live_edges.discard(e)
+		# Probes taken within the transaction are stale
+		self.gen += 1
+		for flow, res, retries in jr.decisions:
+			self.logger.decision(flow, None, retries)
+
+	def release(self):
+		"""
+		Keep every insertion since begin() and close the transaction
+		"""
+		jr = self.journal
+		self.journal = None
+		for flow, res, retries in jr.decisions:
+			self.logger.decision(flow, res, retries)
+
+	def DRPlaceRequest(self, req):
+		"""
+		All-or-nothing admission of a request: every flow is placed, in the given order, or none
+		Output:
+			succ_lst of the placed flows, or None if the request is rejected
+		"""
+		self.begin()
+		succ_lst = []
+		for flow in req:
+			res = self.DRPlaceFlow(flow)
+			if res == None:
+				self.rollback()
+				return None
+			succ_lst.append(res)
+		self.release()
+		return succ_lst
+
+	def DRRequestRouting(self, req_lst):
+		"""
+		Input: [[(), ..., ()], [(), ..., ()]]
+			Requests in the order to admit them, each listing its flows in the order to place them
+		Output:
+			succ_lst, fail_lst of flows, those of a rejected request being all failed
+		"""
+		succ_lst = []
+		fail_lst = []
+		for req in req_lst:
+			res = self.DRPlaceRequest(req)
+			if res == None:
+				fail_lst.extend(req)
+			else:
+				succ_lst.extend(res)
+
+		return succ_lst, fail_lst
+
+	@staticmethod
+	def requestStats(req_lst, succ_lst):
+		"""
+		Request-level outcome of any algorithm
+		Input:
+			req_lst: the requests scheduled; succ_lst: the succeeded list returned
+		Output:
+			(number of requests fully admitted, partially admitted, fully rejected)
+		"""
+		succ_cnt = {}
+		for res in succ_lst:
+			succ_cnt[res[0]] = succ_cnt.get(res[0], 0) + 1
+		full = part = none = 0
+		for req in req_lst:
+			cnt = 0
+			for flow in req:
+				if succ_cnt.get(flow, 0) > 0:
+					# Identical flows of a request are matched one to one
+					succ_cnt[flow] -= 1
+					cnt += 1
+			if cnt == len(req):
+				full += 1
+			elif cnt > 0:
+				part += 1
+			else:
+				none += 1
+		return full, part, none
+
+	######################################
+	# Online admission
+
+	def advance_to(self, time):
+		"""
+		Advance the current time, pruning every breakpoint before it from the event list and the capacity timelines
+			The working set then stays bounded by the deadlines of the flows still active
+		"""
+		if time <= self.now:
+			return
+		self.now = time
+		# Probes taken before can rely on pruned breakpoints
+		self.gen += 1
+		self.event_lst.prune(time)
+		for e in list(self.live_edges):
+			tl = self.DRWritable(e)
+			tl.prune(time)
+			if len(tl) <= 2:
+				# Only the current rate and the infinite timestamp are left
+				self.live_edges.discard(e)
+
+	def probe(self, flows):
+		"""
+		What-if admission: route and validate without reserving anything
+		Input:
+			flows: one flow (s, t, f, a, d), or a list of them such as a request, placed in the given order
+				Each flow of a list sees the allocations of the flows before it
+		Output:
+			DRProbe
+		"""
+		if type(flows) == tuple:
+			flows = [flows]
+		if len(flows) == 1:
+			# A single flow leaves the state untouched anyway, but not the search counters
+			bfs_cnt = self.bfs_cnt
+			bfs_len = len(self.flow_bfs_lst)
+			res_lst = [self.DRProbeFlow(self, flows[0])]
+			self.bfs_cnt = bfs_cnt
+			del self.flow_bfs_lst[bfs_len:]
+		else:
+			sch = self.DRScratch()
+			res_lst = []
+			for flow in flows:
+				res = self.DRProbeFlow(sch, flow)
+				if res != None:
+					sch.DRInsertFlow(flow, res[4], res[2])
+				res_lst.append(res)
+		return DRProbe((self.token, self.gen), [res[:4] if res != None else None for res in res_lst])
+
+	def DRProbeFlow(self, sch, flow):
+		res = sch.DRRouteFlow(flow)
+		if res == None:
+			return None
+		path, path_edge_list, rate_alloc, finish_time = res
+		return (flow, path, rate_alloc, finish_time, path_edge_list)
+
+	def commit(self, probe):
+		"""
+		Reserve the flows of a probe that fit in, reusing its allocations
+		Output:
+			succ_lst of the committed flows, or None if the probe was taken on another scheduler or the state changed since,
+			the probe must then be redone
+		"""
+		if probe.gen != (self.token, self.gen):
+			return None
+		succ_lst = []
+		for res in probe.res_lst:
+			if res == None:
+				continue
+			flow, path, rate_alloc, finish_time = res
+			self.DRInsertFlow(flow, [(path[i], path[i+1]) for i in xrange(len(path)-1)], rate_alloc)
+			succ_lst.append(res)
+		return succ_lst
+
+	def admit(self, flow):
+		"""
+		Decide a single flow as it arrives, advancing the current time to its arriving time first
+		Input:
+			flow: (s, t, f, a, d)
+		Output:
+			(flow, path, rate_alloc, finish_time) if admitted, None if rejected
+		"""
+		self.advance_to(flow[3])
+		return self.DRPlaceFlow(flow)
+
 	def DROfflineNoValuation(self, req_lst):
 		"""
 		Input: [[(), ..., ()], [(), ..., ()]]
 			Tuple: flow
 			List of tuples: request
 			List of lists: all requests
+			Or a DRFlowTable
 		Output:
 			succeeded list, failed list
+			Or a DRFlowResult for a DRFlowTable
 		"""
 
 		# Initialization
 		self.init()
+		if isinstance(req_lst, DRFlowTable):
+			return self.DRTableRouting(req_lst, req_lst.order(DRFlowTable.BY_SIZE), self.DRPlaceFlow)
 		# Generate the list of all flows
 		flow_lst = [tp for l in req_lst for tp in l]
 
@@ -344,12 +993,16 @@ class DRScheduler(DRCommon):
 			Tuple: flow
 			List of tuples: request
 			List of lists: all requests
+			Or a DRFlowTable
 		Output:
 			succeeded list, failed list
+			Or a DRFlowResult for a DRFlowTable
 		"""
 
 		# Initialization
 		self.init()
+		if isinstance(req_lst, DRFlowTable):
+			return self.DRTableRouting(req_lst, req_lst.order(DRFlowTable.BY_ARRIVAL), self.admit)
 		# Generate the list of all flows
 		flow_lst = [tp for l in req_lst for tp in l]
 
@@ -357,11 +1010,84 @@ class DRScheduler(DRCommon):
 		#	Sort by flow size
 		flow_lst_sorted = sorted(flow_lst, key = lambda x:(x[3], x[3]+x[4]))
 
-		# Use the Heuristic algorithm for routing
-		succ_lst, fail_lst = self.DRFlowRouting(flow_lst_sorted)
+		# Admit the flows one by one as they arrive
+		succ_lst = []
+		fail_lst = []
+		for flow in flow_lst_sorted:
+			res = self.admit(flow)
+			if res == None:
+				fail_lst.append(flow)
+			else:
+				succ_lst.append(res)
 
 		return succ_lst, fail_lst
 
+	def DROfflineAllOrNothing(self, req_lst):
+		"""
+		Request-granular offline scheduling: each request has all its flows admitted or none
+		Input: [[(), ..., ()], [(), ..., ()]]
+			Tuple: flow
+			List of tuples: request
+			List of lists: all requests
+			Or a DRFlowTable, its req column grouping the flows
+		Output:
+			succeeded list, failed list
+			Or a DRFlowResult for a DRFlowTable
+		"""
+
+		# Initialization
+		self.init()
+		if isinstance(req_lst, DRFlowTable):
+			return self.DRTableRequestRouting(req_lst)
+
+		# Smallest requests first, then smallest flows first within each request
+		req_lst_sorted = sorted([sorted(req, key = lambda x:(x[2])) for req in req_lst], key = lambda req:sum(x[2] for x in req))
+
+		return self.DRRequestRouting(req_lst_sorted)
+
+	def DROfflineLPBound(self, req_lst, max_intervals = None, merge = None):
+		"""
+		LP relaxation of the offline problem, bounding the acceptance of any algorithm from above
+		Input: [[(), ..., ()], [(), ..., ()]]
+			Or a DRFlowTable
+			max_intervals: intervals of the time expansion, default to DRLPBound.DEF_MAX_INTERVALS
+			merge: how much of the topology is merged, default to DRLPBound.DEF_MERGE
+		Output:
+			DRLPBound, solved: bound, upper(), accept, build_time, solve_time
+		"""
+
+		# Initialization
+		self.init()
+		table = req_lst
+		if not isinstance(table, DRFlowTable):
+			table = DRFlowTable.fromReqLst(req_lst, self.topo.compile().names)
+		lp = DRLPBound(self, table, max_intervals, merge)
+		if lp.solve() == None:
+			self.logger.debug('[DEBUG] Scheduler: LP bound not solved: %s', lp.message)
+		return lp
+
+	def DRTableRequestRouting(self, table):
+		"""
+		DRRequestRouting over the requests of a DRFlowTable, in the order of DROfflineAllOrNothing
+		Output:
+			DRFlowResult
+		"""
+		res = DRFlowResult(table)
+		fl = table.flows
+		order = table.order(DRFlowTable.BY_SIZE)
+		# Flows grouped by request, each group keeping the size order
+		grp = order[numpy.argsort(fl['req'][order], kind='mergesort')]
+		req_ids, st_pos = numpy.unique(fl['req'][grp], return_index=True)
+		ed_pos = numpy.append(st_pos[1:], len(grp))
+		req_size = numpy.add.reduceat(fl['size'][grp], st_pos) if len(grp) else numpy.zeros(0)
+		for r in numpy.argsort(req_size, kind='mergesort').tolist():
+			idx = grp[st_pos[r]:ed_pos[r]].tolist()
+			out = self.DRPlaceRequest([table.flow(i) for i in idx])
+			if out != None:
+				for i, o in zip(idx, out):
+					res.record(i, o[1], o[3])
+		return res
+
 
 
 	######################################
@@ -372,10 +1098,25 @@ class DRScheduler(DRCommon):
 		Find all ECMP using BFS.
 		Input:
 			flow: (s, t, f, a, d)
-			edge_mark: a edge is not counted in if marked as True
+			edge_mark: a edge is not counted in if marked as True, None if no edge is marked
 		Output:
 			p_lst: a list of paths [[s, v11, v12, ..., t], [s, v21, v22, ..., t]]
 		"""
+		if self.paths != None:
+			p_gen = self.paths.paths(flow[0], flow[1], edge_mark)
+			if p_gen != None:
+				p_lst = list(p_gen)
+				if p_lst:
+					return p_lst
+		if edge_mark == None:
+			if self.path_cache != None:
+				# Without marks the path set only depends on (s, t)
+				return self.path_cache.ecmp(flow[0], flow[1]) or False
+			edge_mark = self.DRNewEdgeMark()
+		self.bfs_cnt += 1
+		if self.csr is not None:
+			return self.ECMPBFSCompact(flow, edge_mark)
+
 		# Distance flag for each node
 		d = {v:float('inf') for v in self.topo.nodes}
 		# Parent node for each node
@@ -403,29 +1144,88 @@ class DRScheduler(DRCommon):
 		if d[t] == float('inf'):
 			return False
 
-		# Iteratively find all paths until there is no
+		return self.ECMPPaths(pa, s, t)
+
+	def ECMPBFSCompact(self, flow, edge_mark):
+		"""
+		ECMPBFS on the compact topology, edge_mark being a DREdgeMark
+		"""
+		csr = self.csr
+		self.bfs_gen += 1
+		gen = self.bfs_gen
+		seen = self.bfs_seen
+		d = self.bfs_d
+		pa = self.bfs_pa_lst
+		stamp = edge_mark.stamp
+		mark_gen = edge_mark.gen
+		s = csr.ids[flow[0]]
+		t = csr.ids[flow[1]]
+
+		# BFS to find all min-hop parents, a node being visited once its stamp is the current generation
+		queue = [s]; hdr = 0; d[s] = 0; seen[s] = gen
+		while hdr < len(queue):
+			u = queue[hdr]
+			hdr += 1
+
+			for v, eid in zip(csr.nbr[u], csr.nbr_edge[u]):
+				if stamp[eid] == mark_gen:
+					continue
+				if seen[v] != gen:
+					queue.append(v)
+					seen[v] = gen
+					d[v] = d[u] + 1
+					pa[v] = [u]
+				elif d[v] == d[u] + 1:
+					pa[v].append(u)
+
+		if seen[t] != gen:
+			return False
+
+		return [[csr.names[v] for v in p] for p in self.ECMPPaths(pa, s, t)]
+
+	def ECMPPaths(self, pa, s, t):
+		"""
+		Extract the paths from s to t out of the parent lists of a BFS
+		Output:
+			p_lst: a list of paths [[s, v11, v12, ..., t], [s, v21, v22, ..., t]]
+		"""
+		# Depth-first over the parent lists from t back to s, first parents first
 		p_lst = []
-		while True:
-			p = [t]; v = t; branch = None; branch_idx = None
-			while v != s and v != -1:
-				if len(pa[v]) > 0:
-					if pa[v] > 1:
-						branch = v
-						branch_idx = 0
-					v = pa[v][0]
-					p.append(v)
-				else:
-					break
+		stack = [(t, [t])]
+		while stack:
+			v, p = stack.pop()
 			if v == s:
 				p.reverse()
 				p_lst.append(p)
-			else:
-				break
-			if branch:
-				pa[branch].pop(branch_idx)
+				continue
+			for u in reversed(pa[v]):
+				stack.append((u, p + [u]))
 
 		return p_lst
 
+	def ECMPPlaceFlow(self, flow):
+		"""
+		Route one flow on a random ECMP path and, if it can fit in, deduce its rate
+		Output:
+			(flow, path, rate_alloc, finish_time) if placed, None otherwise
+		"""
+		out = None
+		p_lst = self.ECMPBFS(flow, None)
+		if p_lst:
+			p_idx = numpy.random.randint(0, len(p_lst))
+			p = p_lst[p_idx]
+
+			res = self.DRPathValidation(flow, p)
+			# If false, cannot find a path to fit in
+			if res[0]:
+				# If true, res[1] is the path edge list, res[2] is the rate allocation, res[3] is the finish time of the flow
+				# Can find a path, mark and deduce the rate
+				self.DRInsertFlow(flow, res[1], res[2])
+				out = (flow, p, res[2], res[3])
+		if self.logger.rec_out != None:
+			self.DRDecision(flow, out)
+		return out
+
 	def ECMPFlowRouting(self, flow_lst):
 		"""
 		Input: [(), ()]
@@ -433,33 +1233,15 @@ class DRScheduler(DRCommon):
 		Output:
 			succ_lst, fail_lst
 		"""
-		# For each flow, recursively find paths until either one can fit in or no path
+		# For each flow, pick one of the ECMP paths and validate it
 		succ_lst = []
 		fail_lst = []
 		for flow in flow_lst:
-			edge_mark = {e:False for e in self.topo.edges}
-			p_lst = self.ECMPBFS(flow, edge_mark)
-			if p_lst:
-				p_idx = numpy.random.randint(0, len(p_lst))
-				p = p_lst[p_idx]
-
-				res = self.DRPathValidation(flow, p)
-				path, path_edge_list, rate_alloc, finish_time = None, None, None, None
-				if res[0]:
-					# If true, res[1] is the path edge list, res[2] is the rate allocation, res[3] is the finish time of the flow
-					path = p
-					path_edge_list = res[1]
-					rate_alloc = res[2]
-					finish_time = res[3]
-				if not path_edge_list:
-					# Cannot find a path to fit in
-					fail_lst.append(flow)
-					continue
-				# Can find a path, mark and deduce the rate
-				self.DRInsertFlow(flow, path_edge_list, rate_alloc)
-				succ_lst.append((flow, path, rate_alloc, finish_time))
-				continue
-			fail_lst.append(flow)
+			res = self.ECMPPlaceFlow(flow)
+			if res == None:
+				fail_lst.append(flow)
+			else:
+				succ_lst.append(res)
 
 		return succ_lst, fail_lst
 
@@ -470,12 +1252,16 @@ class DRScheduler(DRCommon):
 			Tuple: flow
 			List of tuples: request
 			List of lists: all requests
+			Or a DRFlowTable
 		Output:
 			succeeded list, failed list
+			Or a DRFlowResult for a DRFlowTable
 		"""
 
 		# Initialization
 		self.init()
+		if isinstance(req_lst, DRFlowTable):
+			return self.DRTableRouting(req_lst, req_lst.order(DRFlowTable.BY_ARRIVAL_SIZE), self.ECMPPlaceFlow)
 		# Generate the list of all flows
 		flow_lst = [tp for l in req_lst for tp in l]
 
@@ -494,3 +1280,150 @@ class DRScheduler(DRCommon):
 
 		return succ_lst, fail_lst
 
+
+	######################################
+	# Multi-path splitting over ECMP
+
+	def DRPathProfiles(self, edge_lst_lst, st_time, ed_time):
+		"""
+		Bottleneck residual rates of paths over [st_time, ed_time], the minimum over every edge at every time
+		Output:
+			times: [st_time, t1, ..., ed_time], common to all paths
+			rates: rates[i, j] is the rate of path i on [times[j], times[j+1])
+		"""
+		edges = list(set(e for edge_lst in edge_lst_lst for e in edge_lst))
+		idx = {e:i for i, e in enumerate(edges)}
+		arrays = [self.rate_lst[e].arrays() for e in edges]
+		times = numpy.unique(numpy.concatenate([[st_time]] + [arr[0] for arr in arrays]))
+		times = times[(times >= st_time) & (times < ed_time)]
+		# Before the start of a pruned timeline the index is -1, i.e. the infinite breakpoint with no capacity
+		edge_rates = numpy.array([arr[1][numpy.searchsorted(arr[0], times, 'right') - 1] for arr in arrays])
+		# Paths of a flow have the same length
+		hops = numpy.array([[idx[e] for e in edge_lst] for edge_lst in edge_lst_lst])
+		return numpy.append(times, ed_time), edge_rates[hops].min(axis = 1)
+
+	def DRProfileAlloc(self, times, rates, size):
+		"""
+		Allocate up to size on a path profile as soon as possible
+		Output:
+			rate_alloc [(-1, 0), (t1, r1), ..., (tn, 0)], allocated size, finish time
+		"""
+		rates = numpy.maximum(rates, 0)
+		# Merge the segments of equal rate, each breakpoint left being one to insert
+		keep = numpy.flatnonzero(numpy.concatenate(([True], rates[1:] != rates[:-1])))
+		times = numpy.append(times[keep], times[-1])
+		rates = rates[keep]
+		seg_size = rates * numpy.diff(times)
+		cum_size = numpy.cumsum(seg_size)
+		seg = numpy.searchsorted(cum_size, size, 'left')
+		if seg >= len(cum_size):
+			# Take the whole profile
+			seg = len(cum_size) - 1
+			finish_time = float(times[-1])
+			size = float(cum_size[-1]) if len(cum_size) else 0
+		else:
+			finish_time = float(size - (cum_size[seg] - seg_size[seg])) / rates[seg] + times[seg]
+		rate_alloc = [(-1, 0)] + zip(times[:seg+1].tolist(), rates[:seg+1].tolist())
+		rate_alloc.append((finish_time, 0))
+		return rate_alloc, size, finish_time
+
+	def DRMultiPathPlaceFlow(self, flow):
+		"""
+		Split one flow over its ECMP paths, filling the path with the most residual volume first.
+			A flow that one path carries stays on it; only the remainder left by the best path goes to the next one.
+			Each path gets its own rate profile, inserted as a sub-flow; all of them are undone if the flow does not fit.
+		Output:
+			(flow, path_lst, rate_alloc_lst, finish_time) if placed, None otherwise
+		"""
+		p_lst = self.ECMPBFS(flow, None)
+		if not p_lst or len(p_lst[0]) < 2:
+			if self.logger.rec_out != None:
+				self.DRDecision(flow, None)
+			return None
+		arr_time = flow[3]
+		end_time = flow[3] + flow[4]
+		edge_lst_lst = [[(p[i], p[i+1]) for i in xrange(len(p)-1)] for p in p_lst]
+		max_paths = self.max_paths if self.max_paths != None else len(p_lst)
+		self.begin()
+		remain = flow[2]
+		path_lst = []; rate_alloc_lst = []; finish_time = arr_time
+		left = range(len(edge_lst_lst))
+		while left and len(path_lst) < max_paths:
+			# Pick the path with the most residual volume, again after each sub-flow since the paths share edges
+			times, rates = self.DRPathProfiles([edge_lst_lst[i] for i in left], arr_time, end_time)
+			vol = numpy.maximum(rates, 0).dot(numpy.diff(times))
+			best = int(numpy.argmax(vol))
+			if vol[best] <= 0:
+				break
+			i = left.pop(best)
+			rate_alloc, size, ed_time = self.DRProfileAlloc(times, rates[best], remain)
+			self.DRInsertFlow(flow, edge_lst_lst[i], rate_alloc)
+			path_lst.append(p_lst[i])
+			rate_alloc_lst.append(rate_alloc)
+			finish_time = max(finish_time, ed_time)
+			remain -= size
+			if remain <= 0:
+				break
+		if remain > 0:
+			self.rollback()
+			res = None
+		else:
+			self.release()
+			res = (flow, path_lst, rate_alloc_lst, finish_time)
+		if self.logger.rec_out != None:
+			self.DRDecision(flow, res)
+		return res
+
+	def DRMultiPathFlowRouting(self, flow_lst):
+		"""
+		Input: [(), ()]
+			List of flow tuples
+		Output:
+			succ_lst, fail_lst
+		"""
+		succ_lst = []
+		fail_lst = []
+		for flow in flow_lst:
+			res = self.DRMultiPathPlaceFlow(flow)
+			if res == None:
+				fail_lst.append(flow)
+			else:
+				succ_lst.append(res)
+
+		return succ_lst, fail_lst
+
+	def DROfflineMultiPath(self, req_lst, max_paths = None):
+		"""
+		DROfflineNoValuation splitting each flow over its ECMP paths
+		Input: [[(), ..., ()], [(), ..., ()]]
+			Tuple: flow
+			List of tuples: request
+			List of lists: all requests
+			Or a DRFlowTable
+			max_paths: most paths a flow is split over, None for all its ECMP paths
+		Output:
+			succeeded list of (flow, path_lst, rate_alloc_lst, finish_time), failed list
+			Or a DRFlowResult for a DRFlowTable
+		"""
+
+		# Initialization
+		self.init()
+		self.max_paths = max_paths
+		if isinstance(req_lst, DRFlowTable):
+			return self.DRTableRouting(req_lst, req_lst.order(DRFlowTable.BY_SIZE), self.DRMultiPathPlaceFlow)
+		# Generate the list of all flows
+		flow_lst = [tp for l in req_lst for tp in l]
+
+		# Sort all flows by flow size
+		flow_lst_sorted = sorted(flow_lst, key = lambda x:(x[2]))
+
+		succ_lst, fail_lst = self.DRMultiPathFlowRouting(flow_lst_sorted)
+
+		return succ_lst, fail_lst
+
+	def DROfflineSinglePath(self, req_lst):
+		"""
+		DROfflineMultiPath keeping each flow on one path, the baseline splitting is measured against
+			Same full-size allocations, unlike the trimmed ones of DROfflineNoValuation
+		"""
+		return self.DROfflineMultiPath(req_lst, max_paths = 1)
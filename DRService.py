@@ -0,0 +1,639 @@
+#####################################################
+#
+# Admission-control service front end of the scheduler
+#
+#####################################################
+
+import argparse
+import collections
+import json
+import math
+import os
+import socket
+import sys
+import threading
+import timeit
+import traceback
+import Queue
+import SocketServer
+import numpy
+
+from DRCommon import *
+from DRTopo import *
+from DRLogger import *
+from DRRequest import *
+from DRFlowTable import *
+from DRScheduler import *
+
+class DRDecision(DRCommon):
+	"""
+	Future of one submission, resolved by the scheduler thread of a DRService.
+		result(): (admitted, path, finish_time) for a flow, path and finish_time being None if rejected,
+			or the list of them for a request
+		latency: seconds from the submission to the decision
+	If the scheduler fails on a flow, result() raises its error while decided() still gives the flows decided before,
+	those admitted staying reserved.
+	"""
+
+	def __init__(self, flows, single, atomic = False, logger = None):
+		self.single = single
+		self.flows = flows
+		self.atomic = atomic
+		self.logger = logger
+		self.res = [None] * len(self.flows)
+		self.pending = len(self.flows)
+		self.error = None
+		self.latency = None
+		self.callbacks = []
+		self.lock = threading.Lock()
+		self.event = threading.Event()
+		self.st = timeit.default_timer()
+
+	def done(self):
+		return self.event.is_set()
+
+	def result(self, timeout = None):
+		"""
+		Wait for the decision
+			Raise: Queue.Empty if it is not there within timeout, the error of the scheduler if it failed
+		"""
+		if not self.event.wait(timeout):
+			raise Queue.Empty('No decision within %s s' % (timeout))
+		if self.error != None:
+			raise self.error
+		return self.res[0] if self.single else self.res
+
+	def decided(self):
+		"""
+		Return: the decision of each flow once done, None for those left undecided by an error
+		"""
+		return list(self.res)
+
+	def add_done_callback(self, fn):
+		"""
+		Call fn(decision) once decided, from the scheduler thread, or right away if already decided
+			Errors of fn are logged and dropped
+		"""
+		with self.lock:
+			if not self.event.is_set():
+				self.callbacks.append(fn)
+				return
+		self.call(fn)
+
+	def call(self, fn):
+		try:
+			fn(self)
+		except Exception:
+			if self.logger != None:
+				self.logger.log('[INFO] Service: decision callback error\n%s' % (traceback.format_exc()))
+
+	def resolve(self, error = None):
+		self.error = error
+		self.latency = timeit.default_timer() - self.st
+		with self.lock:
+			self.event.set()
+			callbacks = self.callbacks
+			self.callbacks = []
+		for fn in callbacks:
+			self.call(fn)
+
+	@staticmethod
+	def toDict(res):
+		"""
+		Return: one decision as the dict of the socket replies
+		"""
+		return {'ok':res[0], 'path':res[1], 'finish':res[2]}
+
+
+class DRService(DRCommon):
+	"""
+	Admission control in front of a scheduler: callers submit flows or requests from any thread and get a DRDecision back,
+	while a dedicated thread owns the scheduler and runs the submissions through the online path, DRScheduler.admit().
+		window: seconds to gather the submissions arriving after the first one into a batch, decided in arriving order
+		adaptive: close a batch as soon as no submission is waiting instead of waiting the whole window,
+			so batches only grow, up to max_batch, with what arrives while the scheduler is busy
+		max_batch: most submissions of a batch
+		queue_size: most submissions waiting; submit() then blocks, or raises Queue.Full past its timeout
+		atomic requests are admitted with all their flows or none, through DRScheduler.DRPlaceRequest()
+	The current time of the scheduler follows the arriving times of the flows.
+	A flow arriving before it, e.g. by losing a race to the batch of a later flow, starts at the current time instead
+	with what is left of its deadline.
+	"""
+
+	DEF_WINDOW		= 0.002
+	DEF_MAX_BATCH	= 256
+	DEF_QUEUE_SIZE	= 1024
+	# Decision latencies kept for the percentiles
+	LAT_SAMPLES		= 100000
+
+	REJECTED		= (False, None, None)
+
+	def __init__(self, sch, window = None, max_batch = None, queue_size = None, adaptive = True):
+		self.sch = sch
+		self.window = window if window != None else DRService.DEF_WINDOW
+		self.adaptive = adaptive
+		self.max_batch = max_batch if max_batch != None else DRService.DEF_MAX_BATCH
+		queue_size = queue_size if queue_size != None else DRService.DEF_QUEUE_SIZE
+		self.queue = Queue.Queue(queue_size)
+		self.thread = None
+		self.lock = threading.Lock()
+		self.clear()
+
+	def clear(self):
+		with self.lock:
+			self.submitted = 0
+			self.busy = 0
+			self.flows = 0
+			self.admitted = 0
+			self.errors = 0
+			self.batches = 0
+			self.max_seen = 0
+			self.lat = collections.deque(maxlen = DRService.LAT_SAMPLES)
+
+	def start(self):
+		if self.thread == None:
+			self.thread = threading.Thread(target = self.run)
+			self.thread.daemon = True
+			self.thread.start()
+		return self
+
+	def stop(self):
+		"""
+		Decide what is queued, then stop the scheduler thread
+		"""
+		if self.thread != None:
+			thread = self.thread
+			self.thread = None
+			self.queue.put(None)
+			thread.join()
+
+	def submit(self, flows, atomic = False, block = True, timeout = None):
+		"""
+		Input:
+			flows: one flow (s, t, f, a, d), or a non-empty list of them such as a request
+			atomic: admit all the flows of the list or none
+			block, timeout: as for Queue.put() when the queue is full
+		Output:
+			DRDecision
+			Raise: ValueError if the service is stopped or a flow is malformed
+		"""
+		if self.thread == None:
+			raise ValueError('Service not started')
+		single = type(flows) == tuple
+		flows = [DRService.flow(flows)] if single else [DRService.flow(flow) for flow in flows]
+		if not flows:
+			raise ValueError('Empty submission')
+		dec = DRDecision(flows, single, atomic, self.sch.logger)
+		try:
+			self.queue.put(dec, block, timeout)
+		except Queue.Full:
+			with self.lock:
+				self.busy += 1
+			raise
+		with self.lock:
+			self.submitted += 1
+		return dec
+
+	@staticmethod
+	def flow(flow):
+		"""
+		Return: flow as a (s, t, f, a, d) tuple with float size and times
+			Raise: ValueError if it is not one
+		"""
+		try:
+			s, t, f, a, d = flow
+			flow = (s, t, float(f), float(a), float(d))
+		except (TypeError, ValueError):
+			raise ValueError('Malformed flow %r, expected (s, t, f, a, d)' % (flow,))
+		if flow[2] < 0 or flow[4] < 0:
+			raise ValueError('Negative size or deadline in flow %r' % (flow,))
+		return flow
+
+	######################################
+	# Scheduler thread
+
+	def run(self):
+		timer = timeit.default_timer
+		stop = False
+		while not stop:
+			dec = self.queue.get()
+			if dec == None:
+				break
+			batch = [dec]
+			ed = timer() + self.window
+			while len(batch) < self.max_batch:
+				wait = ed - timer()
+				try:
+					if wait > 0 and not self.adaptive:
+						dec = self.queue.get(True, wait)
+					else:
+						# Only what is waiting already, an adaptive batch closing once the queue is empty
+						dec = self.queue.get_nowait()
+				except Queue.Empty:
+					break
+				if dec == None:
+					stop = True
+					break
+				batch.append(dec)
+			try:
+				self.DRRunBatch(batch)
+			except Exception as ex:
+				# Whatever failed, the thread goes on and the batch gets the error
+				if self.sch.journal != None:
+					self.sch.rollback()
+				self.sch.logger.log('[INFO] Service: batch error\n%s' % (traceback.format_exc()))
+				failed = [dec for dec in batch if not dec.done()]
+				for dec in failed:
+					dec.resolve(ex)
+				with self.lock:
+					self.errors += len(failed)
+
+	def DRRunBatch(self, batch):
+		"""
+		Decide a batch of submissions, flow by flow in arriving order as DROnlineNoValuation does,
+		an atomic request going as a whole at the arriving time of its first flow
+		"""
+		units = []
+		for dec in batch:
+			if dec.atomic:
+				units.append((min((flow[3], flow[3]+flow[4]) for flow in dec.flows), dec, None))
+			else:
+				for i, flow in enumerate(dec.flows):
+					units.append(((flow[3], flow[3]+flow[4]), dec, i))
+		units.sort(key = lambda x:x[0])
+
+		admitted = 0
+		for key, dec, i in units:
+			if dec.done():
+				# Failed on an earlier flow
+				continue
+			try:
+				if i == None:
+					dec.res = self.DRDecideRequest(dec.flows)
+					dec.pending = 0
+				else:
+					dec.res[i] = self.DRDecideFlow(dec.flows[i])
+					dec.pending -= 1
+			except Exception as ex:
+				if self.sch.journal != None:
+					self.sch.rollback()
+				self.sch.logger.log('[INFO] Service: scheduler error\n%s' % (traceback.format_exc()))
+				dec.resolve(ex)
+				with self.lock:
+					self.errors += 1
+				continue
+			if dec.pending == 0:
+				admitted += sum(1 for res in dec.res if res[0])
+				dec.resolve()
+
+		with self.lock:
+			self.batches += 1
+			self.max_seen = max(self.max_seen, len(batch))
+			self.flows += sum(len(dec.flows) for dec in batch)
+			self.admitted += admitted
+			self.lat.extend(dec.latency for dec in batch if dec.latency != None)
+
+	def DRStartNow(self, flow):
+		"""
+		Return: flow starting no earlier than the current time, or None if its deadline is already past
+		"""
+		now = self.sch.now
+		s, t, f, a, d = flow
+		if a >= now:
+			return flow
+		if a + d <= now:
+			return None
+		return (s, t, f, now, a + d - now)
+
+	def DRDecideFlow(self, flow):
+		flow = self.DRStartNow(flow)
+		if flow == None:
+			return DRService.REJECTED
+		res = self.sch.admit(flow)
+		if res == None:
+			return DRService.REJECTED
+		return (True, res[1], res[3])
+
+	def DRDecideRequest(self, flows):
+		req = [self.DRStartNow(flow) for flow in flows]
+		if None in req:
+			return [DRService.REJECTED] * len(flows)
+		self.sch.advance_to(min(flow[3] for flow in req))
+		succ_lst = self.sch.DRPlaceRequest(req)
+		if succ_lst == None:
+			return [DRService.REJECTED] * len(flows)
+		return [(True, res[1], res[3]) for res in succ_lst]
+
+	######################################
+	# Figures
+
+	def latency(self, pcts = [50, 99]):
+		"""
+		Return: percentiles of the decision latency of the recent submissions, in ms
+		"""
+		with self.lock:
+			lat = list(self.lat)
+		if not lat:
+			return [float('nan')] * len(pcts)
+		return [float(x) for x in numpy.percentile(lat, pcts) * 1000]
+
+	def summary(self):
+		p50, p99 = self.latency()
+		with self.lock:
+			return {'submitted':self.submitted, 'busy':self.busy, 'flows':self.flows, 'admitted':self.admitted,
+					'errors':self.errors, 'batches':self.batches, 'max_batch':self.max_seen,
+					'mean_batch':float(self.submitted - self.queue.qsize()) / self.batches if self.batches else 0.0,
+					'p50_ms':p50, 'p99_ms':p99}
+
+	def report(self):
+		"""
+		Return: the summary as text lines
+		"""
+		summ = self.summary()
+		return ['submissions %8d decided over %d batches, %.1f per batch, %d at most, %d refused busy, %d errors' % (
+					summ['submitted'], summ['batches'], summ['mean_batch'], summ['max_batch'], summ['busy'], summ['errors']),
+				'flows       %8d decided, %d admitted' % (summ['flows'], summ['admitted']),
+				'latency     %8.3f ms p50 %10.3f ms p99' % (summ['p50_ms'], summ['p99_ms'])]
+
+	def log(self, logger, level = DRLogger.INFO):
+		for line in self.report():
+			logger.log('[INFO] Service: %s' % (line), level)
+
+
+######################################
+# Socket front end
+
+class DRServiceHandler(SocketServer.StreamRequestHandler):
+	"""
+	One connection, one JSON object per line each way:
+		{"id": any, "flow": [s, t, f, a, d]} -> {"id": any, "ok": bool, "path": [...] or null, "finish": float or null}
+		{"id": any, "flows": [[s, t, f, a, d], ...], "atomic": bool} -> {"id": any, "decisions": [{"ok", "path", "finish"}, ...]}
+		{"id": any, "error": "busy"} when the queue stays full for the put timeout of the server, or the error otherwise,
+			with the "decisions" taken before it for a list, null for the flows left undecided
+	The lines of a connection are decided one after the other; open more connections for more in flight.
+	"""
+
+	def handle(self):
+		service = self.server.service
+		for line in self.rfile:
+			if not line.strip():
+				continue
+			rep = {}
+			try:
+				msg = json.loads(line)
+				rep['id'] = msg.get('id')
+				if 'flow' in msg:
+					flows = DRServiceHandler.flow(msg['flow'])
+				else:
+					flows = [DRServiceHandler.flow(flow) for flow in msg['flows']]
+				dec = service.submit(flows, msg.get('atomic', False), timeout = self.server.put_timeout)
+				dec.event.wait()
+				if not dec.single:
+					rep['decisions'] = [DRDecision.toDict(r) if r != None else None for r in dec.decided()]
+				res = dec.result()
+				if dec.single:
+					rep.update(DRDecision.toDict(res))
+			except Queue.Full:
+				rep['error'] = 'busy'
+			except Exception as ex:
+				rep['error'] = '%s: %s' % (type(ex).__name__, ex)
+			self.wfile.write(json.dumps(rep, separators = (',', ':')) + '\n')
+			self.wfile.flush()
+
+	@staticmethod
+	def flow(flow):
+		# Node names come as unicode
+		if type(flow) != list or len(flow) != 5:
+			raise ValueError('Malformed flow %r, expected [s, t, f, a, d]' % (flow,))
+		return (str(flow[0]), str(flow[1])) + tuple(flow[2:])
+
+
+class DRTCPServer(SocketServer.ThreadingTCPServer):
+	allow_reuse_address = True
+	daemon_threads = True
+
+
+class DRUnixServer(SocketServer.ThreadingUnixStreamServer):
+	daemon_threads = True
+
+
+def DRParseAddress(addr):
+	"""
+	Return: (host, port) of a 'host:port' address, the path of a Unix socket otherwise
+	"""
+	if ':' in addr:
+		host, port = addr.rsplit(':', 1)
+		return (host, int(port))
+	return addr
+
+
+class DRServiceServer(DRCommon):
+	"""
+	Local socket front end of a DRService, over TCP or a Unix socket
+		address: (host, port), or the path of the Unix socket, which is replaced if it exists
+		put_timeout: seconds a submission may wait for room in the queue before the reply is busy, None to wait
+	"""
+
+	DEF_PUT_TIMEOUT	= 1.0
+
+	def __init__(self, service, address, put_timeout = DEF_PUT_TIMEOUT):
+		if type(address) == tuple:
+			self.server = DRTCPServer(address, DRServiceHandler)
+		else:
+			if os.path.exists(address):
+				os.unlink(address)
+			self.server = DRUnixServer(address, DRServiceHandler)
+		self.server.service = service
+		self.server.put_timeout = put_timeout
+		self.address = self.server.server_address
+		self.thread = None
+
+	def start(self):
+		"""
+		Serve from a background thread
+		"""
+		self.thread = threading.Thread(target = self.server.serve_forever)
+		self.thread.daemon = True
+		self.thread.start()
+		return self
+
+	def serve(self):
+		self.server.serve_forever()
+
+	def stop(self):
+		self.server.shutdown()
+		self.server.server_close()
+		if self.thread != None:
+			self.thread.join()
+			self.thread = None
+		if type(self.address) == str and os.path.exists(self.address):
+			os.unlink(self.address)
+
+
+class DRServiceClient(DRCommon):
+	"""
+	Blocking client of a DRServiceServer, one submission in flight at a time
+	"""
+
+	def __init__(self, address):
+		family = socket.AF_INET if type(address) == tuple else socket.AF_UNIX
+		self.sock = socket.socket(family, socket.SOCK_STREAM)
+		self.sock.connect(address)
+		self.rfile = self.sock.makefile('rb')
+		self.wfile = self.sock.makefile('wb')
+		self.cnt = 0
+
+	def submit(self, flows, atomic = False):
+		"""
+		Output:
+			as DRDecision.result()
+			Raise: Queue.Full if the service is busy, RuntimeError on any other error
+		"""
+		self.cnt += 1
+		if type(flows) == tuple:
+			msg = {'id':self.cnt, 'flow':flows}
+		else:
+			msg = {'id':self.cnt, 'flows':flows, 'atomic':atomic}
+		self.wfile.write(json.dumps(msg, separators = (',', ':')) + '\n')
+		self.wfile.flush()
+		rep = json.loads(self.rfile.readline())
+		if 'error' in rep:
+			if rep['error'] == 'busy':
+				raise Queue.Full('Service busy')
+			raise RuntimeError(rep['error'])
+		if 'decisions' in rep:
+			return [(r['ok'], r['path'], r['finish']) for r in rep['decisions']]
+		return (rep['ok'], rep['path'], rep['finish'])
+
+	def close(self):
+		self.rfile.close()
+		self.wfile.close()
+		self.sock.close()
+
+
+######################################
+# Load test
+
+def DRLoadFlows(k, n, flow_num = 20, seed = 0):
+	"""
+	Return: n flows of DRRequest.QueryAggrBatch over the hosts of a k fattree, in arriving order
+	"""
+	hosts = sorted(DRTopo.FatTree(k).layer[DRCommon.HOST])
+	numpy.random.seed(seed)
+	flows = DRRequest.QueryAggrBatch(len(hosts), int(math.ceil(n / float(flow_num))), flow_num = flow_num)[:n]
+	table = DRFlowTable.fromBatch(flows, hosts)
+	return [table.flow(i) for i in xrange(len(table))]
+
+def DRLoadTest(target, subs, clients = 8, atomic = False):
+	"""
+	Stand-in callers: clients threads share the submissions, taken in order, each waiting for its decision before the next
+	Input:
+		target: a started DRService, or the address of a DRServiceServer
+		subs: submissions, flows or requests
+	Output:
+		dict of the submissions sent, refused busy and failed, the flows admitted and rejected, the wall time,
+		the submissions per second, and the p50 and p99 latency seen by the callers, in ms
+	"""
+	timer = timeit.default_timer
+	lock = threading.Lock()
+	nxt = [0]
+	lat = []
+	cnt = {'sent':0, 'busy':0, 'errors':0, 'admitted':0, 'rejected':0}
+
+	def client():
+		conn = DRServiceClient(target) if not isinstance(target, DRService) else None
+		try:
+			while True:
+				with lock:
+					i = nxt[0]
+					nxt[0] += 1
+				if i >= len(subs):
+					break
+				st = timer()
+				try:
+					if conn != None:
+						res = conn.submit(subs[i], atomic)
+					else:
+						res = target.submit(subs[i], atomic).result()
+				except Queue.Full:
+					with lock:
+						cnt['busy'] += 1
+					continue
+				except Exception:
+					with lock:
+						cnt['errors'] += 1
+					continue
+				elapsed = timer() - st
+				res = [res] if type(subs[i]) == tuple else res
+				ok = sum(1 for r in res if r[0])
+				with lock:
+					lat.append(elapsed)
+					cnt['sent'] += 1
+					cnt['admitted'] += ok
+					cnt['rejected'] += len(res) - ok
+		finally:
+			if conn != None:
+				conn.close()
+
+	threads = [threading.Thread(target = client) for i in xrange(clients)]
+	st = timer()
+	for th in threads:
+		th.start()
+	for th in threads:
+		th.join()
+	total = timer() - st
+	p50, p99 = numpy.percentile(lat, [50, 99]) * 1000 if lat else (float('nan'), float('nan'))
+	cnt.update({'clients':clients, 'time_s':total, 'per_s':cnt['sent'] / total if total > 0 else float('nan'),
+				'p50_ms':float(p50), 'p99_ms':float(p99)})
+	return cnt
+
+def DRLoadReport(res):
+	return ['clients %d: %d sent, %d busy, %d errors in %.3f s, %.1f per s' % (res['clients'], res['sent'], res['busy'], res['errors'],
+				res['time_s'], res['per_s']),
+			'flows %d admitted, %d rejected' % (res['admitted'], res['rejected']),
+			'latency %.3f ms p50 %.3f ms p99 at the callers' % (res['p50_ms'], res['p99_ms'])]
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description = 'Run the admission-control service, or load test it.')
+	parser.add_argument('-k', type = int, default = 4, help = 'fattree arity')
+	parser.add_argument('--serve', default = None, help = 'serve on host:port or a Unix socket path until interrupted')
+	parser.add_argument('--connect', default = None, help = 'load test the server at host:port or a Unix socket path')
+	parser.add_argument('--window', type = float, default = DRService.DEF_WINDOW * 1000, help = 'batching window in ms')
+	parser.add_argument('--fixed-window', action = 'store_true', help = 'wait the whole window for every batch')
+	parser.add_argument('--max-batch', type = int, default = DRService.DEF_MAX_BATCH, help = 'most submissions per batch')
+	parser.add_argument('--queue-size', type = int, default = DRService.DEF_QUEUE_SIZE, help = 'most submissions waiting')
+	parser.add_argument('--flows', type = int, default = 1000, help = 'flows of the load test')
+	parser.add_argument('--flow-num', type = int, default = 20, help = 'flows per request')
+	parser.add_argument('--requests', action = 'store_true', help = 'submit whole requests instead of flows')
+	parser.add_argument('--atomic', action = 'store_true', help = 'admit all the flows of a request or none')
+	parser.add_argument('--clients', type = int, default = 8, help = 'concurrent callers of the load test')
+	parser.add_argument('--seed', type = int, default = 0, help = 'workload seed')
+	args = parser.parse_args()
+
+	service = None
+	if args.connect == None:
+		logger = DRLogger()
+		logger.level = DRLogger.SILENT
+		sch = DRScheduler(DRTopo.FatTree(args.k), logger = logger)
+		service = DRService(sch, args.window / 1000.0, args.max_batch, args.queue_size, not args.fixed_window).start()
+
+	if args.serve != None:
+		server = DRServiceServer(service, DRParseAddress(args.serve))
+		print 'Serving on %s' % (args.serve)
+		try:
+			server.serve()
+		except KeyboardInterrupt:
+			pass
+		server.stop()
+	else:
+		flows = DRLoadFlows(args.k, args.flows, args.flow_num, args.seed)
+		subs = flows
+		if args.requests:
+			subs = [[flow for flow in flows[i:i+args.flow_num]] for i in xrange(0, len(flows), args.flow_num)]
+		res = DRLoadTest(DRParseAddress(args.connect) if args.connect != None else service, subs, args.clients, args.atomic)
+		print '\n'.join(DRLoadReport(res))
+
+	if service != None:
+		service.stop()
+		print '\n'.join(service.report())
@@ -0,0 +1,116 @@
+#####################################################
+#
+# Per-phase timers and counters of the scheduler
+#
+#####################################################
+
+import timeit
+
+from DRCommon import *
+from DRLogger import *
+
+class DRStats(DRCommon):
+	"""
+	Timers and counters of the scheduling phases, collected once attached with DRScheduler.enableStats().
+	Attaching wraps the timed methods of that one scheduler, so a scheduler without stats runs unchanged.
+		calls, time: phase -> number of calls, total wall time; validation includes min_edge, route includes the others
+		retries: extra path searches of each routed flow, in routing order
+		trace: per insertion, (flow arriving time, event list length, breakpoints over the edges of the flow)
+		breakpoints: edge -> breakpoints of its capacity timeline after its last insertion
+		hook: called as hook(phase, elapsed) after each timed call, e.g. to feed an external collector
+	Forks of the scheduler count into the same stats.
+	"""
+
+	# Scheduler methods timed as each phase
+	PHASES = [('route', 'DRRouteFlow'), ('search', 'DRFindPath'), ('search', 'ECMPBFS'),
+				('validation', 'DRPathValidation'), ('min_edge', 'DRFindMinimalEdge'), ('insert', 'DRInsertFlow')]
+
+	def __init__(self, hook = None):
+		self.hook = hook
+		self.clear()
+
+	def clear(self):
+		self.calls = {phase:0 for phase, name in DRStats.PHASES}
+		self.time = {phase:0.0 for phase, name in DRStats.PHASES}
+		self.retries = []
+		self.trace = []
+		self.breakpoints = {}
+
+	def attach(self, sch):
+		"""
+		Wrap the timed methods of sch
+		"""
+		for phase, name in DRStats.PHASES:
+			setattr(sch, name, self.timed(phase, getattr(sch, name), sch))
+
+	@staticmethod
+	def detach(sch):
+		for phase, name in DRStats.PHASES:
+			sch.__dict__.pop(name, None)
+
+	def timed(self, phase, func, sch):
+		calls = self.calls
+		tm = self.time
+		timer = timeit.default_timer
+
+		if phase == 'route':
+			def call(flow):
+				search = calls['search']
+				st = timer()
+				res = func(flow)
+				self.record(phase, timer() - st)
+				self.retries.append(max(calls['search'] - search - 1, 0))
+				return res
+		elif phase == 'insert':
+			def call(flow, edge_lst, rate_alloc):
+				st = timer()
+				res = func(flow, edge_lst, rate_alloc)
+				self.record(phase, timer() - st)
+				bp = 0
+				for e in edge_lst:
+					self.breakpoints[e] = len(sch.rate_lst[e])
+					bp += self.breakpoints[e]
+				self.trace.append((flow[3], len(sch.event_lst), bp))
+				return res
+		else:
+			def call(*args):
+				st = timer()
+				res = func(*args)
+				self.record(phase, timer() - st)
+				return res
+		return call
+
+	def record(self, phase, elapsed):
+		self.calls[phase] += 1
+		self.time[phase] += elapsed
+		if self.hook != None:
+			self.hook(phase, elapsed)
+
+	def summary(self):
+		"""
+		Return: dict of the phase -> (calls, total time, mean time), and the retry and timeline figures
+		"""
+		res = {phase:(self.calls[phase], self.time[phase], self.time[phase] / self.calls[phase] if self.calls[phase] else 0.0)
+				for phase in self.calls}
+		res['retries'] = (sum(self.retries), max(self.retries) if self.retries else 0)
+		res['event_len'] = max(tr[1] for tr in self.trace) if self.trace else 0
+		res['breakpoints'] = max(self.breakpoints.values()) if self.breakpoints else 0
+		return res
+
+	def report(self):
+		"""
+		Return: the summary as text lines
+		"""
+		lines = []
+		for phase in ['route', 'search', 'validation', 'min_edge', 'insert']:
+			calls = self.calls[phase]
+			lines.append('%-10s %8d calls %10.4f s %10.4f ms/call' % (phase, calls, self.time[phase],
+						self.time[phase] * 1000 / calls if calls else 0.0))
+		summ = self.summary()
+		lines.append('retries    %8d total %8d max per flow over %d flows' % (summ['retries'][0], summ['retries'][1], len(self.retries)))
+		lines.append('timelines  %8d events at most, %d breakpoints at most on an edge' % (summ['event_len'], summ['breakpoints']))
+		return lines
+
+	def log(self, logger, level = DRLogger.INFO):
+		for line in self.report():
+			logger.log('[INFO] Stats: %s' % (line), level)
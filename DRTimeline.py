@@ -0,0 +1,169 @@
+#####################################################
+#
+# Residual capacity timeline of a single link
+#
+#####################################################
+
+import numpy
+from bisect import *
+
+from DRCommon import *
+
+class DRTimeline(DRCommon):
+	"""
+	Step function of the residual capacity of a link over time.
+		times: sorted breakpoints [t0, t1, ..., inf]
+		rates: rates[i] is the residual capacity on [times[i], times[i+1])
+	Lookups are done with bisect on the sorted times, so no access ever needs to re-sort.
+	NumPy copies of both lists are cached for vectorized readers until the next update.
+	"""
+
+	def __init__(self, cap = 0, times = None, rates = None):
+		if times is None:
+			# One initial timestamp with full capacity and one infinite timestamp with no capacity
+			self.times = [0, float('inf')]
+			self.rates = [cap, 0]
+		else:
+			self.times = times
+			self.rates = rates
+		self.cache = None
+
+	def copy(self):
+		"""
+		Independent copy, sharing the NumPy cache which is never written in place
+		"""
+		tl = DRTimeline(times = list(self.times), rates = list(self.rates))
+		tl.cache = self.cache
+		return tl
+
+	def __len__(self):
+		return len(self.times)
+
+	def __contains__(self, time):
+		pos = bisect_left(self.times, time)
+		return pos < len(self.times) and self.times[pos] == time
+
+	def __getitem__(self, time):
+		"""
+		Rate stored at exactly the breakpoint time, as for the former {time: rate} dict
+		"""
+		pos = bisect_left(self.times, time)
+		if pos < len(self.times) and self.times[pos] == time:
+			return self.rates[pos]
+		raise KeyError(time)
+
+	def keys(self):
+		return list(self.times)
+
+	def items(self):
+		return zip(self.times, self.rates)
+
+	def arrays(self):
+		"""
+		Return: (times, rates) as float NumPy arrays
+		"""
+		if self.cache is None:
+			self.cache = (numpy.array(self.times, dtype=float), numpy.array(self.rates, dtype=float))
+		return self.cache
+
+	def rate(self, time):
+		"""
+		Residual capacity in effect at time
+		"""
+		pos = bisect_right(self.times, time) - 1
+		if pos < 0:
+			return 0
+		return self.rates[pos]
+
+	def split(self, time):
+		"""
+		Make sure there is a breakpoint at time, carrying the rate in effect there.
+		Return: index of the breakpoint
+		"""
+		pos = bisect_left(self.times, time)
+		if pos < len(self.times) and self.times[pos] == time:
+			return pos
+		if pos == 0:
+			# Before the start of the timeline, nothing to split
+			return 0
+		self.times.insert(pos, time)
+		self.rates.insert(pos, self.rates[pos-1])
+		self.cache = None
+		return pos
+
+	def prune(self, time):
+		"""
+		Drop the breakpoints before time, keeping the rate in effect at time as a breakpoint at time
+		"""
+		pos = bisect_right(self.times, time) - 1
+		if pos < 0 or (pos == 0 and self.times[0] == time):
+			return
+		del self.times[:pos]
+		del self.rates[:pos]
+		self.times[0] = time
+		self.cache = None
+
+	def area(self, st_time, ed_time, bound = float('inf')):
+		"""
+		Cumulative size (integral of the rate) over [st_time, ed_time]
+			bound: stop early and return the partial size as soon as it reaches bound
+		"""
+		times = self.times
+		rates = self.rates
+		pos = bisect_right(times, st_time) - 1
+		if pos < 0:
+			pos = 0
+			st_time = times[0]
+		cum_size = 0
+		prev_time = st_time
+		for i in xrange(pos + 1, len(times)):
+			if cum_size >= bound:
+				break
+			time = times[i]
+			if time >= ed_time:
+				cum_size += rates[i-1] * (ed_time - prev_time)
+				break
+			cum_size += rates[i-1] * (time - prev_time)
+			prev_time = time
+		return cum_size
+
+	def subtract(self, rate_alloc):
+		"""
+		Range-subtract an allocation from the residual capacity, merging it into the breakpoints in one pass.
+		Input:
+			rate_alloc: [(-1, 0), (t1, r1), ..., (tn, 0)], rate ri being allocated on [ti, ti+1), timestamps non-decreasing
+		Every allocation timestamp but the first becomes a breakpoint, unless it is before the start of the timeline.
+		The breakpoints within [t1, tn) (or [t0, tn) if r0 is not 0) are rebuilt segment by segment from slices,
+		then spliced back at once.
+		"""
+		times = self.times
+		rates = self.rates
+		n = len(rate_alloc)
+		first = times[0]
+		# The leading segment, never a breakpoint itself, is left alone when nothing is allocated on it
+		st = 1 if n > 1 and not rate_alloc[0][1] else 0
+		lo = pos = bisect_left(times, rate_alloc[st][0])
+		new_times = []
+		new_rates = []
+		for i in xrange(st, n):
+			time, rate = rate_alloc[i]
+			if i < n - 1 and rate_alloc[i+1][0] == time:
+				# Empty segment, the breakpoint goes with the next one
+				continue
+			if i and time >= first and times[pos] != time:
+				# New breakpoint, carrying the rate in effect before it
+				new_times.append(time)
+				new_rates.append(rates[pos-1] - rate if i < n - 1 else rates[pos-1])
+			if i == n - 1:
+				break
+			ed = bisect_left(times, rate_alloc[i+1][0], pos)
+			new_times.extend(times[pos:ed])
+			if rate:
+				new_rates.extend([r - rate for r in rates[pos:ed]])
+			else:
+				new_rates.extend(rates[pos:ed])
+			pos = ed
+
+		times[lo:pos] = new_times
+		rates[lo:pos] = new_rates
+		self.cache = None
@@ -4,154 +4,283 @@
 #
 #####################################################
 
+import numpy
 import networkx as nx
 from DRCommon import *
+from DRCompactTopo import *
 
 class DRTopo(DRCommon):
 	"""
 	Constructor:
 		topo: networkx graph object
-		file: txt file with specified topology information
+		file: txt file with specified topology information, or a .npz written by writeNpz
 		fattree: if it is nonzero number k, generate a k-ary fattree as the topology using all default parameters
+			(see FatTree, and LeafSpine for two-tier topologies)
+			Given together with topo, it declares topo to be a k-ary fattree named as by FatTree
+		compact: DRCompactTopo to take the topology from
+	A topology generated, read from a file or given as a DRCompactTopo keeps to the arrays: the networkx graph (topo) is only
+	built when first accessed, e.g. by the searches over the graph, and the edge list and the edge attribute dicts
+	(edges, cap, delay, cost) when first read.
 	"""
 
-	def __init__(self, topo = None, file = None, fattree = None):
+	def __init__(self, topo = None, file = None, fattree = None, compact = None):
+		self.fattree = fattree
+		# Bumped by every init(), so derived state such as path caches can tell the topology changed
+		self.version = 0
+		self.graph = None
+		self.compact = None
 		if topo:
 			self.topo = nx.DiGraph(topo)
+		elif compact != None:
+			self.compact = compact
 		elif file:
-			self.topo = DRTopo.parseTopoFile(file)
+			if file.endswith('.npz'):
+				self.compact, k = DRCompactTopo.load(file)
+				if self.fattree == None:
+					self.fattree = k
+			else:
+				self.compact = DRTopo.parseTopoArrays(file)
 		elif fattree:
-			self.topo = nx.DiGraph(DRTopo.genFatTree(fattree))
+			self.compact = DRTopo.FatTree(fattree).compact
 		else:
 			self.topo = nx.DiGraph()
 		self.init()
 
+	@property
+	def topo(self):
+		"""
+		networkx DiGraph of the topology, built from the arrays on first access
+		"""
+		if self.graph is None:
+			self.graph = self.compact.toGraph()
+		return self.graph
+
+	@topo.setter
+	def topo(self, g):
+		self.graph = g
+
+	# Edge list and edge -> attribute dicts, taken from the arrays on first access
+	@property
+	def edges(self):
+		if self.edge_attrs is None:
+			self.initEdges()
+		return self.edge_attrs[0]
+
+	@property
+	def cap(self):
+		if self.edge_attrs is None:
+			self.initEdges()
+		return self.edge_attrs[1]
+
+	@property
+	def delay(self):
+		if self.edge_attrs is None:
+			self.initEdges()
+		return self.edge_attrs[2]
+
+	@property
+	def cost(self):
+		if self.edge_attrs is None:
+			self.initEdges()
+		return self.edge_attrs[3]
+
 	def init(self):
 		"""
 		Initializing all parameters other than the topology
 		"""
-		self.nodes = self.topo.nodes()
-		self.edges = self.topo.edges()
+		self.version += 1
+		if self.graph is None:
+			self.initArrays()
+		else:
+			self.nodes = self.graph.nodes()
+
+			self.layer = {}
+			for node, layer in nx.get_node_attributes(self.graph, 'Layer').items():
+				if layer not in self.layer:
+					self.layer[layer] = []
+				self.layer[layer].append(node)
+			self.edge_attrs = (self.graph.edges(), nx.get_edge_attributes(self.graph, 'Capacity'),
+							nx.get_edge_attributes(self.graph, 'Delay'), nx.get_edge_attributes(self.graph, 'Cost'))
+			# Compact integer representation, compiled on demand
+			self.compact = None
+		edge_num = self.compact.edge_num if self.graph is None else len(self.edges)
+		# A fattree stays known only while all of its directed links are there: k^3 between the switches, two per host
+		if self.fattree and edge_num != self.fattree**3 + 2 * len(self.layer.get(DRCommon.HOST, [])):
+			self.fattree = None
 
+	def initArrays(self):
+		"""
+		init() of a topology held by its DRCompactTopo only
+		"""
+		csr = self.compact
+		names = csr.names
+		self.nodes = list(names)
+		self.edge_attrs = None
 		self.layer = {}
-		for node, layer in nx.get_node_attributes(self.topo, 'Layer').items():
+		for node, layer in zip(names, csr.layer.tolist()):
 			if layer not in self.layer:
 				self.layer[layer] = []
 			self.layer[layer].append(node)
-		self.cap = nx.get_edge_attributes(self.topo, 'Capacity')
-		self.delay = nx.get_edge_attributes(self.topo, 'Delay')
-		self.cost = nx.get_edge_attributes(self.topo, 'Cost')
+
+	def initEdges(self):
+		csr = self.compact
+		edges = list(csr.edge_lst)
+		self.edge_attrs = (edges, dict(zip(edges, csr.cap.tolist())), dict(zip(edges, csr.delay.tolist())),
+						dict(zip(edges, csr.cost.tolist())))
+
+	def compile(self):
+		"""
+		Compile the topology into a DRCompactTopo, kept until the next init()
+		"""
+		if self.compact is None:
+			self.compact = DRCompactTopo.fromGraph(self.graph)
+		return self.compact
+
+	def removeLink(self, u, v, directed = False):
+		"""
+		Remove the link u->v, and v->u as well unless directed, then re-initialize
+			The topology is then held by its networkx graph
+		"""
+		self.topo.remove_edge(u, v)
+		if not directed and self.topo.has_edge(v, u):
+			self.topo.remove_edge(v, u)
+		self.init()
 
 
 	@staticmethod
-	def parseTopoFile(file):
+	def readTopoFile(file):
 		"""
-		Parse a graph file into a topology
+		Stream the records of a graph file, one line at a time
+		Output:
+			generator of ('node', name, layer) and ('edge', u, v, cap, delay, cost), undirected links yielding both directions
+			Layer names known to LAYER_MAP are given as the layer numbers
 		"""
 		dFlg = False	# Directed flg
 		sFlg = 0		# State flg
-		g = nx.DiGraph()
 
-		f = open(file, 'r')
-		ss = f.readlines()
-		for s in ss:
-			s = s.strip()
-			if not s:
-				continue
-			if s[0] == '#':
-				# Commented line
-				continue
-			elif s[0] == '[':
-				# Command line
-				if s.upper() == '[DIRECTED]':
-					dFlg = True
-				elif s.upper() == '[UNDIRECTED]':
-					dFlg = False
-				elif s.upper() == '[NODES]':
-					sFlg = 1
-				elif s.upper() == '[EDGES]':
-					sFlg = 2
+		with open(file, 'r') as f:
+			for s in f:
+				s = s.strip()
+				if not s:
+					continue
+				if s[0] == '#':
+					# Commented line
+					continue
+				elif s[0] == '[':
+					# Command line
+					if s.upper() == '[DIRECTED]':
+						dFlg = True
+					elif s.upper() == '[UNDIRECTED]':
+						dFlg = False
+					elif s.upper() == '[NODES]':
+						sFlg = 1
+					elif s.upper() == '[EDGES]':
+						sFlg = 2
+				else:
+					s = s.split()
+					if sFlg == 1:
+						# Format: NodeName Layer
+						# 	Layer default = -1
+						Layer = -1
+						if len(s) > 1:
+							Layer = s[1].upper()
+							Layer = DRCommon.LAYER_MAP.get(Layer, Layer)
+						yield ('node', s[0], Layer)
+					elif sFlg == 2:
+						# Format: e[0] e[1] Cap Delay Cost
+						#	Cap Delay Cost default = 1
+						Cost = Delay = Cap = 1
+						if len(s) > 4:
+							Cost = float(s[4])
+						if len(s) > 3:
+							Delay = float(s[3])
+						if len(s) > 2:
+							Cap = float(s[2])
+						yield ('edge', s[0], s[1], Cap, Delay, Cost)
+						if not dFlg:
+							yield ('edge', s[1], s[0], Cap, Delay, Cost)
+
+	@staticmethod
+	def parseTopoFile(file):
+		"""
+		Parse a graph file into a topology
+		"""
+		g = nx.DiGraph()
+		for rec in DRTopo.readTopoFile(file):
+			if rec[0] == 'node':
+				g.add_node(rec[1], Layer = rec[2])
 			else:
-				s = s.split()
-				if sFlg == 1:
-					# Format: NodeName Layer
-					# 	Layer default = -1
-					Layer = -1
-					if len(s) > 1:
-						Layer = s[1].upper()
-					g.add_node(s[0], Layer = Layer)
-				elif sFlg == 2:
-					# Format: e[0] e[1] Cap Delay Cost
-					#	Cap Delay Cost default = 1
-					Cost = Delay = Cap = 1
-					if len(s) > 4:
-						Cost = float(s[4])
-					if len(s) > 3:
-						Delay = float(s[3])
-					if len(s) > 2:
-						Cap = float(s[2])
-					g.add_edge(s[0], s[1], Capacity = Cap, Delay = Delay, Cost = Cost)
-					if not dFlg:
-						g.add_edge(s[1], s[0], Capacity = Cap, Delay = Delay, Cost = Cost)
-
-		f.close()
+				g.add_edge(rec[1], rec[2], Capacity = rec[3], Delay = rec[4], Cost = rec[5])
 		return g
 
 	@staticmethod
-	def writeTopoFile(file, g):
+	def parseTopoArrays(file):
 		"""
-		Parse a graph file into a topology
+		Parse a graph file straight into a DRCompactTopo, without a networkx graph
+			As on the graph, a repeated link keeps its first position and its last attributes
 		"""
-		f = open(file, 'w')
+		node_lst = []; layer_lst = []
+		end_lst = []; attr_lst = []
+		for rec in DRTopo.readTopoFile(file):
+			if rec[0] == 'node':
+				node_lst.append(rec[1])
+				layer_lst.append(rec[2] if type(rec[2]) == int else -1)
+			else:
+				end_lst.append(rec[1]); end_lst.append(rec[2])
+				attr_lst.append(rec[3:])
 
-		if type(g) == nx.classes.digraph.DiGraph:
-			f.write('[DIRECTED]\n')
-		else:
-			f.write('[UNDIRECTED]\n')
-		f.write('\n[NODES]\n')
-		for node in g.nodes():
-			f.write(str(node) + ' ' + nx.get_node_attributes(g, 'Layer')[node] + '\n')
-		f.write('\n[EDGES]\n')
-		for e in g.edges():
-			f.write(e[0] + ' ' + e[1] + ' ' + \
-					str(g[e[0]][e[1]]['Capacity']) + ' ' + \
-					str(g[e[0]][e[1]]['Delay']) + ' ' + \
-					str(g[e[0]][e[1]]['Cost']))
-			if type(g) == nx.classes.graph.Graph:
-				f.write(e[1] + ' ' + e[0] + ' ' + \
-						str(g[e[0]][e[1]]['Capacity']) + ' ' + \
-						str(g[e[0]][e[1]]['Delay']) + ' ' + \
-						str(g[e[0]][e[1]]['Cost']))
-
-		f.close()
+		# Number the nodes by first appearance, the declared ones first
+		name_arr = numpy.array(node_lst + end_lst, dtype=object).astype(str) if node_lst or end_lst else numpy.zeros(0, dtype=str)
+		uniq, first, inv = numpy.unique(name_arr, return_index=True, return_inverse=True)
+		rank = numpy.argsort(first, kind='mergesort')
+		nid = numpy.empty(len(uniq), dtype=numpy.int64)
+		nid[rank] = numpy.arange(len(uniq))
+		names = uniq[rank].tolist()
+		layer = numpy.full(len(names), -1, dtype=numpy.int8)
+		# A node declared twice keeps its last layer
+		layer[nid[inv[:len(node_lst)]]] = layer_lst
+
+		src = nid[inv[len(node_lst)::2]]
+		dst = nid[inv[len(node_lst)+1::2]]
+		attr = numpy.array(attr_lst, dtype=float).reshape(-1, 3)
+		# Repeated links: first position, last attributes
+		key = src * len(names) + dst
+		first = numpy.unique(key, return_index=True)[1]
+		last = len(key) - 1 - numpy.unique(key[::-1], return_index=True)[1]
+		order = numpy.argsort(first, kind='mergesort')
+		first = first[order]; last = last[order]
+		src = src[first]; dst = dst[first]
+		cap, delay, cost = attr[last, 0], attr[last, 1], attr[last, 2]
+		return DRCompactTopo(names, layer, src, dst, cap, delay, cost)
 
 	@staticmethod
 	def writeTopoFile(file, g):
 		"""
-		Parse a graph file into a topology
+		Write a topology into a graph file
+			g: networkx graph, or DRTopo
 		"""
-		f = open(file, 'w')
+		if isinstance(g, DRTopo):
+			g = g.topo
+		# Layer numbers are written as their names
+		layer = nx.get_node_attributes(g, 'Layer')
+		with open(file, 'w') as f:
+			if type(g) == nx.classes.digraph.DiGraph:
+				f.write('[DIRECTED]\n')
+			else:
+				f.write('[UNDIRECTED]\n')
+			f.write('\n[NODES]\n')
+			for node in g.nodes():
+				l = layer.get(node, -1)
+				f.write('%s %s\n' % (node, DRCommon.LAYER_MAP.get(l, l)))
+			f.write('\n[EDGES]\n')
+			for u, v, attr in g.edges(data = True):
+				f.write('%s %s %r %r %r\n' % (u, v, attr.get('Capacity', 1), attr.get('Delay', 1), attr.get('Cost', 1)))
 
-		if type(g) == nx.classes.digraph.DiGraph:
-			f.write('[DIRECTED]\n')
-		else:
-			f.write('[UNDIRECTED]\n')
-		f.write('\n[NODES]\n')
-		for node in g.nodes():
-			f.write(str(node) + ' ' + nx.get_node_attributes(g, 'Layer')[node] + '\n')
-		f.write('\n[EDGES]\n')
-		for e in g.edges():
-			f.write(e[0] + ' ' + e[1] + ' ' + \
-					str(g[e[0]][e[1]]['Capacity']) + ' ' + \
-					str(g[e[0]][e[1]]['Delay']) + ' ' + \
-					str(g[e[0]][e[1]]['Cost']))
-			if type(g) == nx.classes.graph.Graph:
-				f.write(e[1] + ' ' + e[0] + ' ' + \
-						str(g[e[0]][e[1]]['Capacity']) + ' ' + \
-						str(g[e[0]][e[1]]['Delay']) + ' ' + \
-						str(g[e[0]][e[1]]['Cost']))
-
-		f.close()
+	def writeNpz(self, file):
+		"""
+		Write the topology in the .npz format, which DRTopo(file = ...) memory-maps back
+		"""
+		self.compile().save(file, self.fattree)
 
 
 	# Default bandwidth, delay, cost of each link
@@ -160,7 +289,42 @@ class DRTopo(DRCommon):
 	DEF_CT	= 1.0		# # of links
 
 	@staticmethod
-	def FatTree(k, attr = None):
+	def linkAttr(attr, tiers):
+		"""
+		Resolve the link attributes of each tier
+			attr: attribute settings, tier_bw, tier_dl, tier_ct falling back to bw, dl, ct, then to the defaults
+		Output:
+			dict of tier -> (bandwidth, delay, cost)
+		"""
+		if attr == None:
+			attr = {}
+		res = {}
+		for tier in tiers:
+			res[tier] = tuple(attr.get('%s_%s' % (tier, key), attr.get(key, default)) for key, default in
+							(('bw', DRTopo.DEF_BW), ('dl', DRTopo.DEF_DL), ('ct', DRTopo.DEF_CT)))
+		return res
+
+	@staticmethod
+	def fromLinks(names, layer, links, fattree = None):
+		"""
+		Build a topology held by its arrays from undirected links
+		Input:
+			names, layer: node id -> node name, layer
+			links: list of (u ids, v ids, (bandwidth, delay, cost)), one entry per tier, each link taken both ways
+		"""
+		src = []; dst = []; cap = []; delay = []; cost = []
+		for u, v, (bw, dl, ct) in links:
+			n = 2 * len(u)
+			src.extend((u, v)); dst.extend((v, u))
+			cap.append(numpy.full(n, bw, dtype=float))
+			delay.append(numpy.full(n, dl, dtype=float))
+			cost.append(numpy.full(n, ct, dtype=float))
+		csr = DRCompactTopo(names, layer, numpy.concatenate(src), numpy.concatenate(dst),
+							numpy.concatenate(cap), numpy.concatenate(delay), numpy.concatenate(cost))
+		return DRTopo(compact = csr, fattree = fattree)
+
+	@staticmethod
+	def FatTree(k, attr = None, hosts = None):
 		"""
 		Generate a k-ary Fat-Tree
 			attr: attribute settings
@@ -176,83 +340,58 @@ class DRTopo(DRCommon):
 				bw: default bandwidth
 				dl: default delay
 				ct: default cost
+			hosts: hosts under each edge switch, default to k/2; more make the tree oversubscribed by hosts/(k/2)
+		Node ids and links are computed arithmetically, the networkx graph (topo) is only built when first accessed.
 		"""
-		g = nx.Graph()
+		half = k / 2
+		if hosts == None:
+			hosts = half
+		attr = DRTopo.linkAttr(attr, ['edge', 'aggr', 'core'])
 
-		# Default values for Fat-Tree setting
-		if attr == None:
-			attr = {'edge_bw':DRTopo.DEF_BW, 'aggr_bw':DRTopo.DEF_BW, 'core_bw':DRTopo.DEF_BW, \
-					'edge_dl':DRTopo.DEF_DL, 'aggr_dl':DRTopo.DEF_DL, 'core_dl':DRTopo.DEF_DL, \
-					'edge_ct':DRTopo.DEF_CT, 'aggr_ct':DRTopo.DEF_CT, 'core_ct':DRTopo.DEF_CT}
-		if 'edge_bw' not in attr.keys():
-			if 'bw' in attr.keys():
-				attr['edge_bw'] = attr['bw']
-			else:
-				attr['edge_bw'] = DRTopo.DEF_BW
-		if 'aggr_bw' not in attr.keys():
-			if 'bw' in attr.keys():
-				attr['aggr_bw'] = attr['bw']
-			else:
-				attr['aggr_bw'] = DRTopo.DEF_BW
-		if 'core_bw' not in attr.keys():
-			if 'bw' in attr.keys():
-				attr['core_bw'] = attr['bw']
-			else:
-				attr['core_bw'] = DRTopo.DEF_BW
-		if 'edge_dl' not in attr.keys():
-			if 'dl' in attr.keys():
-				attr['edge_dl'] = attr['dl']
-			else:
-				attr['edge_dl'] = DRTopo.DEF_DL
-		if 'aggr_dl' not in attr.keys():
-			if 'dl' in attr.keys():
-				attr['aggr_dl'] = attr['dl']
-			else:
-				attr['aggr_dl'] = DRTopo.DEF_DL
-		if 'core_dl' not in attr.keys():
-			if 'dl' in attr.keys():
-				attr['core_dl'] = attr['dl']
-			else:
-				attr['core_dl'] = DRTopo.DEF_DL
-		if 'edge_ct' not in attr.keys():
-			if 'ct' in attr.keys():
-				attr['edge_ct'] = attr['ct']
-			else:
-				attr['edge_ct'] = DRTopo.DEF_CT
-		if 'aggr_ct' not in attr.keys():
-			if 'ct' in attr.keys():
-				attr['aggr_ct'] = attr['ct']
-			else:
-				attr['aggr_ct'] = DRTopo.DEF_CT
-		if 'core_ct' not in attr.keys():
-			if 'ct' in attr.keys():
-				attr['core_ct'] = attr['ct']
-			else:
-				attr['core_ct'] = DRTopo.DEF_CT
-
-		# Nodes
-		g.add_nodes_from(['C-{0}'.format(i) for i in range(0, k*k/4)], Layer = DRCommon.CORE)
-		g.add_nodes_from(['A-{0}-{1}'.format(i, j) for i in range(0, k) for j in range(0, k/2)], Layer = DRCommon.AGGR)
-		g.add_nodes_from(['E-{0}-{1}'.format(i, j) for i in range(0, k) for j in range(0, k/2)], Layer = DRCommon.EDGE)
-		g.add_nodes_from(['H-{0}-{1}-{2}'.format(i, j, l) for i in range(0, k) for j in range(0, k/2) for l in range(0, k/2)], Layer = DRCommon.HOST)
-
-		# Edges
-		for i in range(0, k):
-			# k pods
-			for j in range(0, k/2):
-				# k/2 edge/aggr switches
-				esw = 'E-{0}-{1}'.format(i, j)
-				for l in range(0, k/2):
-					# k/2 hosts for each edge switch
-					h = 'H-{0}-{1}-{2}'.format(i, j, l)
-					g.add_edge(esw, h, Capacity=attr['edge_bw'], Delay=attr['edge_dl'], Cost = attr['edge_ct'])
-					# k/2 aggrs for each edge
-					asw = 'A-{0}-{1}'.format(i, l)
-					g.add_edge(asw, esw, Capacity=attr['aggr_bw'], Delay=attr['aggr_dl'], Cost = attr['aggr_ct'])
-				asw = 'A-{0}-{1}'.format(i, j)
-				for l in range(0, k/2):
-					# k/2 core switches connected to the aggregate switch
-					csw = 'C-{0}'.format(j*k/2+l)
-					g.add_edge(csw, asw, Capacity=attr['core_bw'], Delay=attr['core_dl'], Cost = attr['core_ct'])
-
-		return DRTopo(nx.DiGraph(g))
+		# Nodes: k^2/4 core switches, then k^2/2 aggr switches, k^2/2 edge switches and their hosts, pod by pod
+		sw_num = k * half
+		core_num = half * half
+		a0 = core_num
+		e0 = a0 + sw_num
+		h0 = e0 + sw_num
+		names = ['C-{0}'.format(i) for i in xrange(core_num)]
+		names += ['A-{0}-{1}'.format(i, j) for i in xrange(k) for j in xrange(half)]
+		names += ['E-{0}-{1}'.format(i, j) for i in xrange(k) for j in xrange(half)]
+		names += ['H-{0}-{1}-{2}'.format(i, j, l) for i in xrange(k) for j in xrange(half) for l in xrange(hosts)]
+		layer = numpy.repeat([DRCommon.CORE, DRCommon.AGGR, DRCommon.EDGE, DRCommon.HOST],
+							[core_num, sw_num, sw_num, sw_num * hosts])
+
+		# Switch E-i-j (id i*k/2+j among the edge switches) holds hosts H-i-j-0 ... H-i-j-(hosts-1)
+		edge_host = (e0 + numpy.repeat(numpy.arange(sw_num), hosts), h0 + numpy.arange(sw_num * hosts))
+		# In pod i, every A-i-l connects to every E-i-j
+		pod, l, j = numpy.indices((k, half, half)).reshape(3, -1)
+		aggr_edge = (a0 + pod * half + l, e0 + pod * half + j)
+		# A-i-j connects to the core switches C-(j*k/2) ... C-(j*k/2+k/2-1)
+		pod, j, l = numpy.indices((k, half, half)).reshape(3, -1)
+		core_aggr = (j * half + l, a0 + pod * half + j)
+
+		return DRTopo.fromLinks(names, layer, [edge_host + (attr['edge'],), aggr_edge + (attr['aggr'],),
+												core_aggr + (attr['core'],)], fattree = k)
+
+	@staticmethod
+	def LeafSpine(leaves, spines, hosts, attr = None):
+		"""
+		Generate a two-tier leaf-spine topology, every leaf switch connecting to every spine switch
+			leaves, spines: number of leaf and spine switches, named L-i and S-j
+			hosts: hosts under each leaf, named H-i-l; the leaves are oversubscribed by
+				hosts * edge_bw / (spines * core_bw)
+			attr: attribute settings as for FatTree, edge_* for the host links and core_* for the leaf-spine links
+		"""
+		attr = DRTopo.linkAttr(attr, ['edge', 'core'])
+		names = ['S-{0}'.format(j) for j in xrange(spines)]
+		names += ['L-{0}'.format(i) for i in xrange(leaves)]
+		names += ['H-{0}-{1}'.format(i, l) for i in xrange(leaves) for l in xrange(hosts)]
+		layer = numpy.repeat([DRCommon.CORE, DRCommon.EDGE, DRCommon.HOST], [spines, leaves, leaves * hosts])
+
+		l0 = spines
+		h0 = l0 + leaves
+		leaf_host = (l0 + numpy.repeat(numpy.arange(leaves), hosts), h0 + numpy.arange(leaves * hosts))
+		leaf, spine = numpy.indices((leaves, spines)).reshape(2, -1)
+		spine_leaf = (spine, l0 + leaf)
+
+		return DRTopo.fromLinks(names, layer, [leaf_host + (attr['edge'],), spine_leaf + (attr['core'],)])
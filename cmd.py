@@ -1,6 +1,11 @@
+import argparse
+import os
+import time
+
 from DRTopo import *
 from DRRequest import *
 from DRScheduler import *
+from DRExperiment import *
 
 
 
@@ -32,12 +37,6 @@ def printResults(succ_lst, fail_lst):
 
 
 
-
-
-topo = DRTopo.FatTree(4)
-hosts = topo.layer[DRCommon.HOST]
-scheduler = DRScheduler(topo)
-
 # req_lst = [
 # 	[('H-0-0-0', 'H-1-1-1', 0.8, 0, 1)],
 # 	[('H-0-0-1', 'H-1-1-0', 0.4, 0, 1)],
@@ -45,51 +44,45 @@ scheduler = DRScheduler(topo)
 # 	[('H-0-0-0', 'H-1-1-0', 0.5, 0, 1)],
 # ]
 
-test_num = 50
-succ_cum = 0; fail_cum = 0
-succ_cum1 = 0; fail_cum1 = 0
-succ_cum2 = 0; fail_cum2 = 0
-for i in xrange(test_num):
-	print 'Run %d in process.' % (i+1)
-	num_req = 40
-	req_lst = []
-	for i in xrange(num_req):
-		req = DRRequest.QueryAggr(hosts, flow_num=20)
-		req_lst.append(req)
-
-	#printReqLst(req_lst)
-
-	succ_lst, fail_lst = scheduler.DROfflineNoValuation(req_lst)
-	succ_cum += len(succ_lst)
-	fail_cum += len(fail_lst)
-	succ_lst, fail_lst = scheduler.DROnlineNoValuation(req_lst)
-	succ_cum1 += len(succ_lst)
-	fail_cum1 += len(fail_lst)
-	succ_lst, fail_lst = scheduler.ECMPOffline(req_lst)
-	succ_cum2 += len(succ_lst)
-	fail_cum2 += len(fail_lst)
-	#print '================================================================'
-
-b
-	#printResults(succ_lst, fail_lst)
-	#print len(succ_lst), len(fail_lst)
-
-succ_cum /= float(test_num)
-fail_cum /= float(test_num)
-succ_cum1 /= float(test_num)
-fail_cum1 /= float(test_num)
-succ_cum2 /= float(test_num)
-fail_cum2 /= float(test_num)
-#print succ_cum, fail_cum
-#print succ_cum1, fail_cum1
-#print succ_cum2, fail_cum2
-
-print 'Algorithm: Deadline-aware Routing Offline'
-print '\tSucceeded:', succ_cum
-print '\tFailed:', fail_cum
-print 'Algorithm: Deadline-aware Routing Online'
-print '\tSucceeded:', succ_cum1
-print '\tFailed:', fail_cum1
-print 'Algorithm: PDQ + ECMP Online'
-print '\tSucceeded:', succ_cum2
-print '\tFailed:', fail_cum2
\ No newline at end of file
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description = 'Compare the scheduling algorithms over independent trials.')
+	parser.add_argument('-k', type = int, default = 4, help = 'fattree arity')
+	parser.add_argument('--trials', type = int, default = 50, help = 'number of trials')
+	parser.add_argument('--requests', type = int, default = 40, help = 'requests per trial')
+	parser.add_argument('--flows', type = int, default = 20, help = 'flows per request')
+	parser.add_argument('--core-bw', type = float, default = None,
+						help = 'core link bandwidth, below the default to make the core the bottleneck')
+	parser.add_argument('--seed', type = int, default = 0, help = 'seed of the first trial')
+	parser.add_argument('--procs', type = int, default = None, help = 'worker processes, default to the number of cores')
+	parser.add_argument('--profile', choices = DRProfiler.MODES, default = None,
+						help = 'profile every run with cProfile (pstats files) or by sampling (collapsed stacks)')
+	parser.add_argument('--profile-dir', default = None, help = 'directory of the profiles, default to profiles/<date-time>')
+	parser.add_argument('--profile-top', type = int, default = 20, help = 'hot functions reported')
+	args = parser.parse_args()
+
+	profile_dir = args.profile_dir
+	if args.profile and profile_dir == None:
+		profile_dir = os.path.join('profiles', time.strftime('%Y%m%d-%H%M%S'))
+	exp = DRExperiment(k = args.k, test_num = args.trials, num_req = args.requests, flow_num = args.flows, seed = args.seed, procs = args.procs,
+						profile = args.profile, profile_dir = profile_dir,
+						attr = {'core_bw':args.core_bw} if args.core_bw != None else None)
+	print 'Running %d trials on %d processes.' % (exp.test_num, exp.procs)
+	res = exp.run()
+
+	names = [('DROfflineNoValuation', 'Deadline-aware Routing Offline'),
+			('DROnlineNoValuation', 'Deadline-aware Routing Online'),
+			('ECMPOffline', 'PDQ + ECMP Online'),
+			('DROfflineAllOrNothing', 'Deadline-aware Routing Offline, all-or-nothing requests'),
+			('DROfflineMultiPath', 'Deadline-aware Routing Offline, flows split over ECMP paths'),
+			('DROfflineSinglePath', 'Deadline-aware Routing Offline, flows kept on one ECMP path')]
+	for alg, name in names:
+		print 'Algorithm: %s' % (name)
+		print '\tSucceeded:', res[alg][0]
+		print '\tFailed:', res[alg][1]
+		print '\tRequests fully admitted: %s of %d' % (res[alg][2], exp.num_req)
+
+	if args.profile:
+		print
+		print 'Profiles in %s:' % (profile_dir)
+		for line in exp.profileReport(args.profile_top):
+			print '\t%s' % (line)